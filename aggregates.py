@@ -0,0 +1,78 @@
+# Parcel counts by status, region and payment type for the dashboard and the
+# ops wall display.
+#
+# Registered as a store listener like the search and dashboard indexes, so
+# every write path (forms, change requests, ingest, imports, archiving, and
+# other workers' writes picked up on refresh/sync) updates the counters by
+# one parcel. Reading the summary never walks the parcels. rebuild() counts
+# from scratch, and check() compares the live counters with such a rebuild.
+import collections, threading
+
+FACETS = ('status', 'region', 'payment_type')
+
+
+class ParcelAggregates:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._facets = {}
+        self._counts = {f: collections.Counter() for f in FACETS}
+
+    def _values(self, parcel):
+        return tuple(str(parcel.get(f) or '').strip() for f in FACETS)
+
+    def _count(self, values, step):
+        for facet, value in zip(FACETS, values):
+            counter = self._counts[facet]
+            counter[value] += step
+            if counter[value] <= 0:
+                del counter[value]
+
+    # Store listener hooks
+    def reset(self, parcels):
+        with self._lock:
+            self._facets = {}
+            self._counts = {f: collections.Counter() for f in FACETS}
+            for p in parcels:
+                values = self._values(p)
+                self._facets[p['id']] = values
+                self._count(values, 1)
+
+    def apply(self, parcel_id, parcel):
+        with self._lock:
+            old = self._facets.pop(parcel_id, None)
+            if old is not None:
+                self._count(old, -1)
+            if parcel is not None:
+                values = self._values(parcel)
+                self._facets[parcel_id] = values
+                self._count(values, 1)
+
+    # {'total': n, 'status': {value: n}, 'region': {...}, 'payment_type': {...}},
+    # values sorted by count, largest first
+    def summary(self):
+        with self._lock:
+            result = {'total': len(self._facets)}
+            for facet in FACETS:
+                result[facet] = dict(self._counts[facet].most_common())
+            return result
+
+    def rebuild(self, parcels):
+        self.reset(parcels)
+        return self.summary()
+
+    # Differences between the live counters and a full count of `parcels`,
+    # as {facet: {value: (live, actual)}}; empty when they agree
+    def check(self, parcels):
+        fresh = ParcelAggregates()
+        fresh.reset(parcels)
+        live, actual = self.summary(), fresh.summary()
+        diff = {}
+        if live['total'] != actual['total']:
+            diff['total'] = (live['total'], actual['total'])
+        for facet in FACETS:
+            values = set(live[facet]) | set(actual[facet])
+            wrong = {v: (live[facet].get(v, 0), actual[facet].get(v, 0))
+                     for v in values if live[facet].get(v, 0) != actual[facet].get(v, 0)}
+            if wrong:
+                diff[facet] = wrong
+        return diff
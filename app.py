@@ -1,65 +1,381 @@
 # Project main files are here i import flask and other required modules 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import json, os, datetime, re, random
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, g
+import json, os, datetime, re, time, hashlib
 from werkzeug.utils import secure_filename
+from werkzeug.http import is_resource_modified
+from werkzeug.middleware.proxy_fix import ProxyFix
+from storage import open_stores, config_from_env
+from migrations import migrate_data
+from parcel_store import VersionConflict
+from search_index import TrigramIndex
+from dashboard_index import DashboardIndex
+from aggregates import ParcelAggregates
+from event_index import EventIndex
+from timestamps import format_event_timestamp, canonical_event_timestamp, now_event_timestamp
+from ingest import decode_events, ingest_events, MAX_BATCH_EVENTS
+from parcel_io import export_parcels, import_parcels, FORMATS as EXPORT_FORMATS
+from geocoder import Geocoder, LRUCache, make_provider
+from tracking_ids import IdAllocator, check_tracking_id
+from archive import ParcelArchive, restore_parcel
+from live_updates import ParcelEventHub, HubFull
+from chatbot import RateLimiter, find_tracking_ids, match_intent, MAX_IDS_PER_MESSAGE, MAX_MESSAGE_LENGTH
+from metrics import REGISTRY, InstrumentedStore
+from profiler import SamplingProfiler
 
 # Initialize the application
 app = Flask(__name__)
 app.secret_key = 'trackswift_secret'
 app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
 
+# Behind a load balancer (Render) the proxy is every client's address.
+# TRACKSWIFT_PROXY_HOPS is how many proxies in front of the app append to
+# X-Forwarded-For; request.remote_addr, which the rate limits are keyed on,
+# is then the address the nearest trusted proxy saw. Off by default, since
+# without a proxy clients could pick their own address; the deploy configs
+# set it.
+app.config['PROXY_HOPS'] = int(os.environ.get('TRACKSWIFT_PROXY_HOPS', 0))
+if app.config['PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'], x_proto=app.config['PROXY_HOPS'])
+
 # Check if upload folder exists
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
 # Data file paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
+DATA_DIR = os.environ.get('TRACKSWIFT_DATA_DIR', os.path.join(BASE_DIR, 'data'))
 PARCEL_FILE = os.path.join(DATA_DIR, 'parcels.json')
 CHANGE_REQUESTS_FILE = os.path.join(DATA_DIR, 'change_requests.json')
 
-# Helper function to get parcel data
-def load_parcels():
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    if not os.path.exists(PARCEL_FILE):
-        with open(PARCEL_FILE, 'w') as f:
-            json.dump([], f)
-    with open(PARCEL_FILE, 'r') as f:
-        data = json.load(f)
-        # Ensure data consistency
-        for p in data:
-            if 'image' not in p: p['image'] = ''
-            if 'start_address' not in p: p['start_address'] = ''
-            if 'end_address' not in p: p['end_address'] = p.get('address', '')
-            if 'tracking_history' not in p: p['tracking_history'] = []
-            if 'current_location' not in p: p['current_location'] = p.get('address', '')
-            # Migration for names
-            if 'sender_name' not in p: p['sender_name'] = 'Unknown Sender'
-            if 'receiver_name' not in p: p['receiver_name'] = p.get('name', 'Unknown Receiver')
-            # Ensure name is receiver_name for backward compatibility if needed, or just use receiver_name
-            p['name'] = p['receiver_name'] 
-        return data
-
-# Helper function to save parcel data
-def save_parcels(parcels):
-    with open(PARCEL_FILE, 'w') as f:
-        json.dump(parcels, f, indent=4)
-
-# Helper function to get change requests
-def load_change_requests():
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    if not os.path.exists(CHANGE_REQUESTS_FILE):
-        with open(CHANGE_REQUESTS_FILE, 'w') as f:
-            json.dump([], f)
-    with open(CHANGE_REQUESTS_FILE, 'r') as f:
-        return json.load(f)
-
-# Helper function to save change requests
-def save_change_requests(requests):
-    with open(CHANGE_REQUESTS_FILE, 'w') as f:
-        json.dump(requests, f, indent=4)
+# Storage backend: 'json' (default) or 'sqlite', see storage.py
+app.config.update(config_from_env(DATA_DIR))
+# Upgrade data files from older schema versions once, before anything reads them
+migrate_data(app.config)
+parcel_store, change_request_store = open_stores(app.config)
+
+# Metrics for /metrics: per-route latency, store call latency and data file sizes
+REQUEST_SECONDS = REGISTRY.histogram(
+    'trackswift_request_seconds', 'Request latency by route', ('route', 'method'))
+REQUESTS_TOTAL = REGISTRY.counter(
+    'trackswift_requests_total', 'Requests by route and status code', ('route', 'method', 'status'))
+STORE_CALL_SECONDS = REGISTRY.histogram(
+    'trackswift_store_call_seconds', 'Store method latency', ('store', 'call'))
+parcel_store = InstrumentedStore(parcel_store, 'parcels', STORE_CALL_SECONDS)
+change_request_store = InstrumentedStore(change_request_store, 'change_requests', STORE_CALL_SECONDS)
+app.config['METRICS_TOKEN'] = os.environ.get('TRACKSWIFT_METRICS_TOKEN', '')
+# ?profile=1 returns a sampled profile instead of the page, for admins or when enabled for everyone
+app.config['PROFILING'] = os.environ.get('TRACKSWIFT_PROFILING', '0') == '1'
+
+def data_file_sizes():
+    paths = {
+        'parcels': app.config['PARCEL_FILE'],
+        'parcel_journal': os.path.splitext(app.config['PARCEL_FILE'])[0] + '.journal',
+        'change_requests': app.config['CHANGE_REQUESTS_FILE'],
+        'sqlite': app.config['SQLITE_PATH'],
+        'sqlite_wal': app.config['SQLITE_PATH'] + '-wal'
+    }
+    return {(name,): os.path.getsize(path) for name, path in paths.items() if os.path.exists(path)}
+
+REGISTRY.callback_gauge('trackswift_data_file_bytes', 'Size of each data file', ('file',), data_file_sizes)
+
+# Trigram index for name/phone/email search, kept up to date by the store
+SEARCH_PAGE_SIZE = 20
+search_index = TrigramIndex()
+
+# Hub scanners post to /api/events with this bearer token (admins can use their session)
+app.config['INGEST_TOKEN'] = os.environ.get('TRACKSWIFT_INGEST_TOKEN', '')
+
+# Admin change-request queue page size
+REQUESTS_PAGE_SIZE = 50
+
+# Sorted/faceted index behind the paginated dashboard API
+DASHBOARD_PAGE_SIZE = 50
+dashboard_index = DashboardIndex(search_index)
+
+# Parcel counts by status/region/payment type, updated on every write
+parcel_aggregates = ParcelAggregates()
+
+# Time-ordered tracking events for the ops queries (hub activity, stuck parcels, lane transit times)
+OPS_QUERY_LIMIT = 1000
+event_index = EventIndex()
+
+def parcels_by_status():
+    parcel_store.sync()
+    return {(status,): n for status, n in parcel_aggregates.summary()['status'].items()}
+
+REGISTRY.callback_gauge('trackswift_parcels', 'Parcels in the hot store by status', ('status',), parcels_by_status)
+
+# Live tracking streams, fed by the store like the indexes (see live_updates.py).
+# Off unless TRACKSWIFT_LIVE_UPDATES=1: an open stream holds a worker thread,
+# so it needs the gthread workers from the Procfile, and TRACKSWIFT_STREAM_MAX
+# must stay below their --threads to leave room for ordinary requests.
+app.config['LIVE_UPDATES'] = os.environ.get('TRACKSWIFT_LIVE_UPDATES', '0') == '1'
+live_hub = ParcelEventHub(parcel_store.sync, max_subscribers=int(os.environ.get('TRACKSWIFT_STREAM_MAX', 24)))
+REGISTRY.callback_gauge('trackswift_open_streams', 'Open live tracking streams', (),
+                        lambda: {(): live_hub.subscriber_count()})
+
+# Reset every index from one load of the parcels; the search index goes first
+# because the dashboard index uses it
+parcel_store.add_listeners(search_index, dashboard_index, parcel_aggregates, event_index, live_hub)
+
+# Delivered parcels moved out of the hot store by archive.py, read-only
+parcel_archive = ParcelArchive(os.path.join(DATA_DIR, 'archive'))
+
+# Tracking IDs come from a sequence shared by all workers, see tracking_ids.py
+id_allocator = IdAllocator(os.path.join(DATA_DIR, 'id_sequence'))
+
+# Server-side geocoder for the map: LRU, disk cache, offline gazetteer, then upstream
+geocoder = Geocoder(
+    os.path.join(DATA_DIR, 'geocode_cache.ndjson'),
+    os.path.join(BASE_DIR, 'data', 'gazetteer.json'),  # ships with the code, not the data dir
+    provider=make_provider(os.environ.get('TRACKSWIFT_GEOCODER', 'nominatim')),
+    max_disk_entries=int(os.environ.get('TRACKSWIFT_GEOCODE_CACHE_MAX', 100000))
+)
+
+# Upstream lookups are serialised at one per second, so each client gets a
+# burst of TRACKSWIFT_GEOCODE_BURST, refilled at TRACKSWIFT_GEOCODE_PER_MINUTE
+geocode_limiter = RateLimiter(rate=float(os.environ.get('TRACKSWIFT_GEOCODE_PER_MINUTE', 12)) / 60,
+                              burst=int(os.environ.get('TRACKSWIFT_GEOCODE_BURST', 6)))
+
+# Event times are stored as ISO 8601 and only formatted for display, in templates
+app.jinja_env.filters['event_time'] = format_event_timestamp
+
+# Part of every page ETag, so a deploy that changes a template is not answered
+# with 304s for the old layout: TRACKSWIFT_STATIC_VERSION (e.g. the git SHA),
+# else a hash of the templates
+def templates_digest():
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(BASE_DIR, 'templates'))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\0' + f.read())
+    return digest.hexdigest()[:12]
+
+app.config['STATIC_VERSION'] = os.environ.get('TRACKSWIFT_STATIC_VERSION') or templates_digest()
+
+# Rendered per-parcel pages and chat replies, keyed by parcel version (see parcel_page)
+page_cache = LRUCache(int(os.environ.get('TRACKSWIFT_PAGE_CACHE_SIZE', 1024)))
+
+# The chat widget is on every page; each client (by address) gets a burst of
+# TRACKSWIFT_CHAT_BURST messages, refilled at TRACKSWIFT_CHAT_PER_MINUTE
+chat_limiter = RateLimiter(rate=float(os.environ.get('TRACKSWIFT_CHAT_PER_MINUTE', 30)) / 60,
+                           burst=int(os.environ.get('TRACKSWIFT_CHAT_BURST', 10)))
+
+# Request timing and optional per-request profiling
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request.args.get('profile') == '1' and (app.config['PROFILING'] or session.get('admin')):
+        g.profiler = SamplingProfiler().start()
+
+def record_request(status):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+    REQUESTS_TOTAL.inc(route=route, method=request.method, status=status)
+
+@app.after_request
+def finish_request_timer(response):
+    record_request(response.status_code)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        header = f'# {request.method} {request.path}: {profiler.samples} samples in {profiler.elapsed:.3f}s\n'
+        return Response(header + profiler.collapsed(), mimetype='text/plain')
+    return response
+
+# Requests that raised never reach after_request
+@app.teardown_request
+def finish_failed_request(error):
+    if error is not None:
+        record_request(500)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+
+# Prometheus Metrics
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Not authorized\n', status=401, mimetype='text/plain')
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Helper function to search parcels by name, phone or email, best matches first
+def search_parcels(query, page=1, per_page=None):
+    parcel_store.sync()
+    ids, total = search_index.search(query, page, per_page or SEARCH_PAGE_SIZE)
+    return [p for p in (parcel_store.get(i) for i in ids) if p], total
+
+# Helper function to approve and reject change requests in one pass, with one
+# parcel write and one queue write. Returns {request_id: outcome}.
+def process_change_requests(approve_ids=(), reject_ids=()):
+    results = {}
+    approved = []
+    for request_id in approve_ids:
+        req = change_request_store.get(request_id)
+        if req is None:
+            results[request_id] = 'not_found'
+        elif request_id not in results:
+            approved.append(req)
+            results[request_id] = 'approved'
+
+    # Merge field changes per parcel, oldest request first so the newest wins
+    changes = {}
+    for req in sorted(approved, key=lambda r: r.get('created_at') or ''):
+        fields = changes.setdefault(req['id'], {})
+        if req.get('new_address'):
+            fields['address'] = req['new_address']
+        if req.get('new_phone'):
+            fields['phone'] = req['new_phone']
+        if req.get('new_region'):
+            fields['region'] = req['new_region']
+    missing = set()
+    with parcel_store.batch():
+        for parcel_id, fields in changes.items():
+            if parcel_store.get(parcel_id) is None:
+                missing.add(parcel_id)
+            elif fields:
+                parcel_store.update(parcel_id, fields)
+    for req in approved:
+        if req['id'] in missing:
+            results[req['request_id']] = 'parcel_not_found'
+
+    for request_id in reject_ids:
+        if request_id not in results:
+            results[request_id] = 'rejected' if change_request_store.get(request_id) else 'not_found'
+
+    change_request_store.remove([i for i, r in results.items() if r != 'not_found'])
+    return results
+
+# Helper function to pick the parcels for a batch action: the given IDs, or
+# every parcel matching the dashboard filters (status, region, payment_type,
+# exclude_status) and search text. IDs are matched exactly, as the store
+# holds them. Returns (ids, None) or (None, (message, status code)).
+def select_parcel_ids(ids, filters, query, limit):
+    wanted = list(dict.fromkeys(i.strip() for i in ids if i.strip()))
+    if not wanted:
+        if not any(filters.get(f) for f in ('status', 'region', 'payment_type')) and not query:
+            return None, ('Give ids or at least one filter (status, region, payment_type, q)', 400)
+        parcel_store.sync()
+        wanted, more = dashboard_index.page(filters=filters, query=query, limit=limit)
+        if more:
+            return None, (f'More than {limit} parcels match, narrow the filter', 413)
+    if len(wanted) > limit:
+        return None, (f'At most {limit} parcels per batch', 413)
+    return wanted, None
+
+# Helper function to apply one admin action to many parcels in a single store
+# batch (one journal write or one SQLite transaction). Approve and reject only
+# touch parcels still waiting for approval; with `filters` a parcel that no
+# longer matches them by the time the batch runs is left alone.
+# update sets `fields` and appends `event` (if given) to each parcel.
+# Returns {parcel_id: outcome}.
+def process_parcel_actions(action, parcel_ids, fields=None, event=None, filters=None):
+    fields = fields or {}
+    filters = filters or {}
+    facet_filters = {f: {v.lower() for v in filters[f]} for f in ('status', 'region', 'payment_type') if filters.get(f)}
+    excluded = {v.lower() for v in filters.get('exclude_status', ())}
+    results = {}
+    with parcel_store.batch():
+        parcels = {p['id']: p for p in parcel_store.get_many(parcel_ids)}
+        timestamp = now_event_timestamp()
+        for parcel_id in parcel_ids:
+            parcel = parcels.get(parcel_id)
+            if parcel is None:
+                results[parcel_id] = 'not_found'
+            elif str(parcel.get('status') or '').lower() in excluded or any(
+                    str(parcel.get(f) or '').lower() not in values for f, values in facet_filters.items()):
+                results[parcel_id] = 'no_longer_matches'
+            elif action in ('approve', 'reject') and parcel.get('status') != 'Pending Approval':
+                results[parcel_id] = 'not_pending'
+            elif action == 'approve':
+                parcel_store.update(parcel_id, {'status': 'Pending Pickup'})
+                if not parcel['tracking_history']:
+                    parcel_store.append_event(parcel_id, {'status': 'Request Approved', 'location': 'Admin Center', 'timestamp': timestamp})
+                results[parcel_id] = 'approved'
+            elif action in ('reject', 'delete'):
+                parcel_store.delete(parcel_id)
+                results[parcel_id] = 'rejected' if action == 'reject' else 'deleted'
+            else:
+                if fields:
+                    parcel_store.update(parcel_id, fields)
+                if event:
+                    parcel_store.append_event(parcel_id, dict(
+                        event, location=event.get('location') or fields.get('current_location') or parcel.get('current_location', ''),
+                        timestamp=timestamp))
+                results[parcel_id] = 'updated'
+    return results
+
+# Helper function to look a parcel up in the hot store, then in the archive
+def get_parcel(parcel_id):
+    return parcel_store.get(parcel_id) or parcel_archive.get(parcel_id)
+
+# Helper function to look several parcels up in one pass, hot store then
+# archive. Returns {id: parcel} for the IDs that exist.
+def get_parcels(parcel_ids):
+    found = {p['id']: p for p in parcel_store.get_many(parcel_ids)}
+    missing = [i for i in parcel_ids if i not in found]
+    if missing:
+        found.update((p['id'], p) for p in parcel_archive.get_many(missing))
+    return found
+
+# Helper function to read parcels a chunk at a time in the order given, hot
+# store then archive for each chunk, so a long list never sits in memory
+def iter_parcels(parcel_ids, chunk_size=500):
+    for start in range(0, len(parcel_ids), chunk_size):
+        chunk = parcel_ids[start:start + chunk_size]
+        found = get_parcels(chunk)
+        yield from (found[i] for i in chunk if i in found)
+
+# Helper function to build a strong ETag for a parcel. Every write bumps the
+# version and updated_at; parcels never written through the store have
+# neither, so their content is hashed instead.
+def parcel_etag(parcel, *variant):
+    if parcel.get('updated_at'):
+        state = f"{parcel['id']}|{parcel.get('version', 0)}|{parcel['updated_at']}"
+    else:
+        state = json.dumps(parcel, sort_keys=True)
+    return hashlib.sha1('|'.join(map(str, (app.config['STATIC_VERSION'], state) + variant)).encode('utf-8')).hexdigest()
+
+def parcel_last_modified(parcel):
+    try:
+        return datetime.datetime.fromisoformat(parcel['updated_at'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+# Helper function to serve a page about one parcel with ETag/Last-Modified.
+# A client holding the current copy gets a bare 304; otherwise the render is
+# reused while the parcel is unchanged. Pages carrying flashed messages are
+# always rendered, so the message is shown and consumed.
+def parcel_page(kind, parcel, render, cacheable=True):
+    etag = parcel_etag(parcel, kind, bool(session.get('admin')), app.config['LIVE_UPDATES'])
+    flashes = bool(session.get('_flashes'))
+    if request.method == 'GET' and not flashes and not is_resource_modified(
+            request.environ, etag=etag, last_modified=parcel_last_modified(parcel)):
+        response = Response(status=304)
+    else:
+        body = None if flashes else page_cache.get(etag)
+        if body is None:
+            body = render()
+            if cacheable and not flashes:
+                page_cache.put(etag, body)
+        response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    response.last_modified = parcel_last_modified(parcel)
+    # Per session (the nav differs for admins), and checked again on every visit
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Helper function to issue a new tracking ID, skipping any that were imported already
+def new_tracking_id():
+    parcel_id = id_allocator.next_id()
+    while get_parcel(parcel_id) is not None:
+        parcel_id = id_allocator.next_id()
+    return parcel_id
 
 # --- Application Routes ---
 
@@ -86,55 +402,136 @@ def security():
 def support():
     return render_template('support.html')
 
+# Points shown on a parcel's map: (kind, title, parcel field)
+MAP_POINTS = (('start', 'Start Location', 'start_address'),
+              ('current', 'Current Location', 'current_location'),
+              ('end', 'Destination', 'end_address'))
+
+# Helper function to get the (kind, title, address) map points of a parcel
+def map_points(parcel):
+    points = []
+    for kind, title, field in MAP_POINTS:
+        address = parcel.get(field)
+        if not address or (kind == 'current' and address == parcel.get('start_address')):
+            continue
+        points.append((kind, title, address))
+    return points
+
 # View Map Page
 @app.route('/view_map/<id>')
 def view_map(id):
-    parcels = load_parcels()
-    parcel = next((p for p in parcels if p['id'] == id), None)
+    parcel = get_parcel(id)
     if not parcel:
         return "Parcel not found", 404
-    return render_template('map_view.html', parcel=parcel)
+    # Only cached/gazetteer coordinates here, the page asks /api/geocode for the rest
+    points = []
+    for kind, title, address in map_points(parcel):
+        coords = geocoder.resolve(address, upstream=False)
+        points.append({'kind': kind, 'title': title, 'address': address,
+                       'lat': coords['lat'] if coords else None, 'lon': coords['lon'] if coords else None})
+    # Not cached until every point has coordinates, so later visits embed them
+    return parcel_page('map', parcel, lambda: render_template('map_view.html', parcel=parcel, points=points),
+                       cacheable=all(p['lat'] is not None for p in points))
+
+# Geocoding API for map points the page could not resolve from the caches.
+# Only a parcel's own addresses are looked up, never free text.
+@app.route('/api/geocode')
+def geocode_api():
+    client = request.remote_addr or ''
+    if not geocode_limiter.allow(client):
+        retry_after = str(int(geocode_limiter.retry_after(client)) + 1)
+        return jsonify({'error': 'Too many lookups, try again later'}), 429, {'Retry-After': retry_after}
+    parcel_id = request.args.get('id', '').strip()
+    kind = request.args.get('point', '').strip()
+    if not parcel_id or not kind:
+        return jsonify({'error': "Missing 'id' or 'point'"}), 400
+    parcel = get_parcel(parcel_id)
+    if not parcel:
+        return jsonify({'error': 'Parcel not found'}), 404
+    address = next((a for k, _, a in map_points(parcel) if k == kind), None)
+    if address is None:
+        return jsonify({'error': f'Parcel has no {kind} point'}), 404
+    try:
+        result = geocoder.resolve(address)
+    except Exception as e:
+        return jsonify({'error': f'Geocoding provider failed: {e}'}), 502
+    if result is None:
+        return jsonify({'error': 'Address not found'}), 404
+    return jsonify(dict(result, query=address))
 
 # Tracking Page
 @app.route('/track', methods=['GET', 'POST'])
 def track():
-    if request.method == 'POST':
-        query = request.form['tracking_id'].strip().lower()
-        parcels = load_parcels()
-        
-        found_parcel = None
-        
+    query = request.form.get('tracking_id') if request.method == 'POST' else request.args.get('tracking_id')
+    if query is not None:
+        query = query.strip()
+        # A mistyped ID fails its check digit, no need to look it up
+        if check_tracking_id(query) == 'invalid':
+            return render_template('track.html', invalid_id=True)
+
         # Search by ID first
-        for parcel in parcels:
-            if parcel['id'].lower() == query:
-                found_parcel = parcel
-                break
-        
-        # Search by Receiver Name or Sender Name if not found
-        if not found_parcel:
-            for parcel in parcels:
-                if query in parcel['receiver_name'].lower() or query in parcel['sender_name'].lower():
-                    found_parcel = parcel
-                    break
-        
+        found_parcel = parcel_store.find(query) or parcel_archive.find(query)
         if found_parcel:
-             return render_template('track.html', parcel=found_parcel)
+            return parcel_page('track', found_parcel, lambda: render_template('track.html', parcel=found_parcel))
+        
+        # Search by Receiver Name, Sender Name, Phone or Email if not found
+        page = request.args.get('page', 1, type=int)
+        matches, total = search_parcels(query, page)
+        if len(matches) == 1 and total == 1:
+            return parcel_page('track', matches[0], lambda: render_template('track.html', parcel=matches[0]))
+        if matches:
+            return render_template('track.html', matches=matches, query=query, page=page,
+                                   total=total, per_page=SEARCH_PAGE_SIZE)
              
         return render_template('track.html', not_found=True)
     return render_template('track.html')
 
+# Live Tracking Stream (Server-Sent Events) for the track and map pages.
+# ?version= (or Last-Event-ID on reconnect) is the version the page already shows.
+@app.route('/api/track/<id>/stream')
+def track_stream(id):
+    if not app.config['LIVE_UPDATES']:
+        return jsonify({'error': 'Live updates are disabled'}), 404
+    try:
+        subscriber = live_hub.subscribe(id)
+    except HubFull:
+        return jsonify({'error': 'Too many live streams, try again later'}), 503, {'Retry-After': '30'}
+    parcel = get_parcel(id)
+    if not parcel:
+        live_hub.unsubscribe(subscriber)
+        return jsonify({'error': 'Parcel not found'}), 404
+    live_hub.start(subscriber, parcel, request.headers.get('Last-Event-ID') or request.args.get('version'))
+    return Response(live_hub.stream(subscriber), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Parcel Search API
+@app.route('/api/search')
+def search_api():
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), 100)
+    matches, total = search_parcels(request.args.get('q', ''), page, per_page)
+    return jsonify({
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'results': [{
+            'id': p['id'],
+            'sender_name': p['sender_name'],
+            'receiver_name': p['receiver_name'],
+            'status': p['status']
+        } for p in matches]
+    })
+
 # Handle Address Change Requests
 @app.route('/request_change', methods=['POST'])
 def request_change():
     request_data = {
         'id': request.form['id'],
-        'new_address': request.form['new_address'],
-        'new_phone': request.form['new_phone'],
-        'new_region': request.form['new_region']
+        'new_address': request.form.get('new_address', ''),
+        'new_phone': request.form.get('new_phone', ''),
+        'new_region': request.form.get('new_region', '')
     }
-    requests = load_change_requests()
-    requests.append(request_data)
-    save_change_requests(requests)
+    change_request_store.add(request_data)
     flash('Change Request Sent to Admin.')
     return redirect('/track')
 
@@ -153,17 +550,133 @@ def login():
 def dashboard():
     if not session.get('admin'):
         return redirect('/login')
-    parcels = load_parcels()
-    requests_count = len(load_change_requests())
-    return render_template('dashboard.html', parcels=parcels, requests_count=requests_count)
+    requests_count = change_request_store.count()
+    parcel_store.sync()
+    return render_template('dashboard.html', requests_count=requests_count, page_size=DASHBOARD_PAGE_SIZE,
+                           stats=parcel_aggregates.summary())
+
+# Parcel Counts API for the dashboard and the ops wall display.
+# Served from counters kept by the store, so polling it never scans the parcels.
+# ?verify=1 (admins only) also recounts everything and reports any drift.
+@app.route('/api/stats')
+def stats_api():
+    token = app.config['METRICS_TOKEN']
+    if not session.get('admin') and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        return jsonify({'error': 'Not authorized'}), 401
+    parcel_store.sync()
+    stats = parcel_aggregates.summary()
+    stats['change_requests'] = change_request_store.count()
+    stats['archived'] = parcel_archive.count()
+    if request.args.get('verify') == '1':
+        if not session.get('admin'):
+            return jsonify({'error': 'Login required'}), 401
+        stats['drift'] = parcel_aggregates.check(parcel_store.all())
+    return jsonify(stats)
+
+# Ops Query APIs, answered from the event index without scanning the parcels.
+# Same access as /api/stats: admins, or the metrics bearer token.
+def ops_authorized():
+    token = app.config['METRICS_TOKEN']
+    return session.get('admin') or (token and request.headers.get('Authorization') == f'Bearer {token}')
+
+def ops_limit():
+    return max(1, min(request.args.get('limit', OPS_QUERY_LIMIT, type=int), OPS_QUERY_LIMIT))
+
+# Events at a hub: ?hub=Bhiwandi Hub&hours=1, or ?since=/&until= as ISO 8601
+@app.route('/api/ops/hub_events')
+def hub_events_api():
+    if not ops_authorized():
+        return jsonify({'error': 'Not authorized'}), 401
+    hub = request.args.get('hub', '').strip()
+    if not hub:
+        return jsonify({'error': "Missing 'hub'"}), 400
+    try:
+        if request.args.get('since'):
+            since = canonical_event_timestamp(datetime.datetime.fromisoformat(request.args['since']))
+        else:
+            hours = request.args.get('hours', 1, type=float)
+            since = canonical_event_timestamp(datetime.datetime.now() - datetime.timedelta(hours=hours))
+        until = request.args.get('until')
+        until = canonical_event_timestamp(datetime.datetime.fromisoformat(until)) if until else None
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO 8601 times'}), 400
+    parcel_store.sync()
+    events, total = event_index.events_at(hub, since, until, limit=ops_limit())
+    return jsonify({'hub': hub, 'since': since, 'until': until, 'total': total, 'events': events})
+
+# Parcels with no new event for more than ?hours=24, optionally ?status= (repeatable)
+@app.route('/api/ops/stuck')
+def stuck_parcels_api():
+    if not ops_authorized():
+        return jsonify({'error': 'Not authorized'}), 401
+    hours = request.args.get('hours', 24, type=float)
+    parcel_store.sync()
+    parcels, total = event_index.stuck(hours, now_event_timestamp(), request.args.getlist('status'), limit=ops_limit())
+    return jsonify({'hours': hours, 'total': total, 'parcels': parcels})
+
+# Transit time percentiles of delivered parcels per lane (origin city to
+# destination city): ?percentile=50&percentile=90, ?origin=, ?destination=, ?min_count=
+@app.route('/api/ops/lanes')
+def lanes_api():
+    if not ops_authorized():
+        return jsonify({'error': 'Not authorized'}), 401
+    percentiles = request.args.getlist('percentile', type=float) or [50, 90, 99]
+    if not all(0 < p <= 100 for p in percentiles):
+        return jsonify({'error': 'Percentiles must be in (0, 100]'}), 400
+    parcel_store.sync()
+    lanes = event_index.lane_percentiles(percentiles, request.args.get('origin'), request.args.get('destination'),
+                                         request.args.get('min_count', 1, type=int))
+    return jsonify({'lanes': lanes})
+
+# Paginated Parcel List API for the dashboard
+@app.route('/api/parcels')
+def parcels_api():
+    if not session.get('admin'):
+        return jsonify({'error': 'Login required'}), 401
+    filters = {
+        'status': request.args.getlist('status'),
+        'exclude_status': request.args.getlist('exclude_status'),
+        'region': request.args.getlist('region'),
+        'payment_type': request.args.getlist('payment_type')
+    }
+    limit = max(1, min(request.args.get('limit', DASHBOARD_PAGE_SIZE, type=int), 200))
+    parcel_store.sync()
+    try:
+        ids, next_cursor = dashboard_index.page(
+            sort=request.args.get('sort', 'id'),
+            order=request.args.get('order', 'asc'),
+            cursor=request.args.get('cursor'),
+            limit=limit,
+            filters=filters,
+            query=request.args.get('q', '').strip()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    parcels = []
+    for parcel_id in ids:
+        parcel = parcel_store.get(parcel_id)
+        if parcel:
+            row = {k: v for k, v in parcel.items() if k != 'tracking_history'}
+            row['last_event'] = parcel['tracking_history'][-1] if parcel['tracking_history'] else None
+            parcels.append(row)
+    return jsonify({'parcels': parcels, 'next_cursor': next_cursor})
 
 # Add New Parcel Logic
 @app.route('/add_parcel', methods=['POST'])
 def add_parcel():
     if not session.get('admin'):
         return redirect('/login')
+    # Kept exactly as entered, like every lookup by ID; the stores allow no two
+    # IDs that differ only in case, so the duplicate check ignores it
+    parcel_id = request.form['id'].strip()
+    if parcel_id and check_tracking_id(parcel_id) == 'invalid':
+        flash(f'{parcel_id} is not a valid tracking ID (check digit mismatch).')
+        return redirect('/dashboard')
+    if parcel_id and (parcel_store.find(parcel_id) or parcel_archive.find(parcel_id)) is not None:
+        flash(f'A parcel with ID {parcel_id} already exists.')
+        return redirect('/dashboard')
     new_parcel = {
-        'id': request.form['id'] or ('TRK' + str(datetime.datetime.now().timestamp()).replace('.', '')[-5:]),
+        'id': parcel_id or new_tracking_id(),
         'sender_name': request.form['sender_name'],
         'receiver_name': request.form['receiver_name'],
         'name': request.form['receiver_name'], # Keep for compatibility
@@ -187,9 +700,7 @@ def add_parcel():
             filename = secure_filename(file.filename)
             file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
             new_parcel['image'] = 'uploads/' + filename
-    parcels = load_parcels()
-    parcels.append(new_parcel)
-    save_parcels(parcels)
+    parcel_store.add(new_parcel)
     return redirect('/dashboard')
 
 # Approve Parcel Request
@@ -197,13 +708,13 @@ def add_parcel():
 def approve_parcel(id):
     if not session.get('admin'):
         return redirect('/login')
-    parcels = load_parcels()
-    for p in parcels:
-        if p['id'] == id:
-            p['status'] = 'Pending Pickup'
-            if not p['tracking_history']:
-                p['tracking_history'].append({'status': 'Request Approved', 'location': 'Admin Center', 'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M")})
-    save_parcels(parcels)
+    # Re-read inside the batch so a concurrent approval does not add a second event
+    with parcel_store.batch():
+        parcel = parcel_store.get(id)
+        if parcel:
+            parcel_store.update(id, {'status': 'Pending Pickup'})
+            if not parcel['tracking_history']:
+                parcel_store.append_event(id, {'status': 'Request Approved', 'location': 'Admin Center', 'timestamp': now_event_timestamp()})
     flash('Parcel Request Approved!')
     return redirect('/dashboard')
 
@@ -212,9 +723,7 @@ def approve_parcel(id):
 def reject_parcel(id):
     if not session.get('admin'):
         return redirect('/login')
-    parcels = load_parcels()
-    parcels = [p for p in parcels if p['id'] != id]
-    save_parcels(parcels)
+    parcel_store.delete(id)
     flash('Parcel Request Rejected.')
     return redirect('/dashboard')
 
@@ -224,17 +733,102 @@ def delete_parcel():
     if not session.get('admin'):
         return redirect('/login')
     parcel_id = request.form['id']
-    parcels = load_parcels()
-    parcels = [parcel for parcel in parcels if parcel['id'] != parcel_id]
-    save_parcels(parcels)
+    parcel_store.delete(parcel_id)
     return redirect('/dashboard')
 
+# Bulk Parcel Actions: approve, reject, delete, or update status/location with
+# an optional tracking event, for a list of IDs or everything matching a filter
+BULK_ACTIONS = ('approve', 'reject', 'delete', 'update')
+MAX_BULK_PARCELS = 5000
+
+# Helper function to validate and run a bulk action. Returns
+# (results, None) or (None, (message, status code)).
+def run_bulk_action(action, ids, filters, query, fields, event):
+    if action not in BULK_ACTIONS:
+        return None, (f"action must be one of {', '.join(BULK_ACTIONS)}", 400)
+    fields = {k: v.strip() for k, v in fields.items() if v and v.strip()}
+    if action == 'update' and not fields and event is None:
+        return None, ('Give a status, a location or a tracking event to update', 400)
+    if event is not None and not (event.get('status') or fields.get('status')):
+        return None, ('The tracking event needs a status', 400)
+    parcel_ids, error = select_parcel_ids(ids, filters, query, MAX_BULK_PARCELS)
+    if error:
+        return None, error
+    if event is not None:
+        event = {
+            'status': event.get('status') or fields['status'],
+            'subtext': event.get('subtext', ''),
+            'description': event.get('description', ''),
+            'location': event.get('location', '')
+        }
+    # Filters are re-checked in the batch, explicit IDs are taken as given
+    return process_parcel_actions(action, parcel_ids, fields, event, None if ids else filters), None
+
+def bulk_summary(results):
+    counts = {}
+    for outcome in results.values():
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+# Form version for the dashboard and the approvals page, flashes a summary
+@app.route('/bulk_parcels', methods=['POST'])
+def bulk_parcels():
+    if not session.get('admin'):
+        return redirect('/login')
+    form = request.form
+    event = None
+    if form.get('add_event'):
+        event = {k: form.get(f'event_{k}', '').strip() for k in ('status', 'location', 'description', 'subtext')}
+    results, error = run_bulk_action(
+        form.get('action', ''),
+        form.getlist('id') + [i for v in form.getlist('ids') for i in re.split(r'[\s,]+', v)],
+        {f: form.getlist(f'filter_{f}') for f in ('status', 'region', 'payment_type', 'exclude_status')},
+        form.get('filter_q', '').strip(),
+        {'status': form.get('status', ''), 'current_location': form.get('current_location', '')},
+        event
+    )
+    if error:
+        flash(error[0])
+    else:
+        counts = bulk_summary(results)
+        flash(', '.join(f"{n} {outcome.replace('_', ' ')}" for outcome, n in counts.items()) or 'Nothing selected.')
+    next_page = form.get('next', '')
+    return redirect(next_page if next_page.startswith('/') and not next_page.startswith('//') else '/dashboard')
+
+# JSON version: {"action": ..., "ids": [...] or "filter": {"status": [...],
+# "region": [...], "payment_type": [...], "exclude_status": [...], "q": ...}, "status": ...,
+# "current_location": ..., "event": {"status", "location", "description", "subtext"}}
+@app.route('/api/parcels/bulk', methods=['POST'])
+def bulk_parcels_api():
+    if not session.get('admin'):
+        return jsonify({'error': 'Login required'}), 401
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids') or []
+    filters = data.get('filter') or {}
+    event = data.get('event')
+    if event is True:
+        event = {}
+    if not isinstance(ids, list) or not isinstance(filters, dict) or not isinstance(event, (dict, type(None))):
+        return jsonify({'error': "'ids' must be a list, 'filter' and 'event' objects"}), 400
+    # A filter value can be one string or a list of them
+    values = lambda v: [str(x) for x in v] if isinstance(v, list) else [str(v)] if v else []
+    results, error = run_bulk_action(
+        str(data.get('action', '')),
+        [str(i) for i in ids],
+        {f: values(filters.get(f)) for f in ('status', 'region', 'payment_type', 'exclude_status')},
+        str(filters.get('q') or '').strip(),
+        {'status': str(data.get('status') or ''), 'current_location': str(data.get('current_location') or '')},
+        {k: str(v or '').strip() for k, v in event.items()} if event is not None else None
+    )
+    if error:
+        return jsonify({'error': error[0]}), error[1]
+    return jsonify({'results': results, 'counts': bulk_summary(results)})
+
 # Create Parcel Page
 @app.route('/create_parcel', methods=['GET', 'POST'])
 def create_parcel():
     if request.method == 'POST':
-        # Generate random ID
-        parcel_id = 'TRK' + str(random.randint(10000, 99999))
+        parcel_id = new_tracking_id()
         
         new_parcel = {
             'id': parcel_id,
@@ -251,7 +845,7 @@ def create_parcel():
             'payment_type': request.form.get('payment_type', 'Prepaid'),
             'region': request.form.get('region', 'India'),
             'image': '',
-            'tracking_history': [{'status': 'Order Placed', 'location': 'Online', 'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}],
+            'tracking_history': [{'status': 'Order Placed', 'location': 'Online', 'timestamp': now_event_timestamp()}],
             'current_location': 'Sender Location'
         }
 
@@ -262,9 +856,7 @@ def create_parcel():
                 file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
                 new_parcel['image'] = 'uploads/' + filename
         
-        parcels = load_parcels()
-        parcels.append(new_parcel)
-        save_parcels(parcels)
+        parcel_store.add(new_parcel)
         return render_template('create_parcel.html', success=True, tracking_id=parcel_id, receiver_name=request.form['receiver_name'])
     return render_template('create_parcel.html')
 
@@ -274,47 +866,71 @@ def edit_parcel(id):
     if not session.get('admin'):
         return redirect('/login')
     
-    parcels = load_parcels()
-    parcel = next((p for p in parcels if p['id'] == id), None)
+    # Archived parcels are shown from the archive and only come back to the
+    # hot store when an edit is saved
+    parcel = parcel_store.get(id)
+    archived = parcel is None
+    if archived:
+        parcel = parcel_archive.get(id)
     
     if not parcel:
         return "Parcel not found", 404
 
     if request.method == 'POST':
-        parcel['status'] = request.form['status']
-        parcel['current_location'] = request.form['current_location']
-        parcel['start_address'] = request.form['start_address']
-        parcel['end_address'] = request.form['end_address']
-        parcel['sender_name'] = request.form.get('sender_name', parcel.get('sender_name', ''))
-        parcel['receiver_name'] = request.form.get('receiver_name', parcel.get('receiver_name', ''))
-        parcel['name'] = parcel['receiver_name']  # Sync name
+        changes = {
+            'status': request.form['status'],
+            'current_location': request.form['current_location'],
+            'start_address': request.form['start_address'],
+            'end_address': request.form['end_address'],
+            'sender_name': request.form.get('sender_name', parcel.get('sender_name', '')),
+            'receiver_name': request.form.get('receiver_name', parcel.get('receiver_name', ''))
+        }
+        changes['name'] = changes['receiver_name']  # Keep for compatibility
         
         # Add tracking history
+        new_event = None
         new_status_header = request.form.get('new_status_header')
         if new_status_header:
             new_desc = request.form.get('new_description', '')
             new_date = request.form.get('new_date')
             new_time = request.form.get('new_time')
             
-            # Format date and time
-            formatted_ts = f"{new_date} {new_time}"
+            # Stored as ISO 8601, left empty it is now
             try:
-                dt_obj = datetime.datetime.strptime(f"{new_date} {new_time}", "%Y-%m-%d %H:%M")
-                day = dt_obj.day
-                suffix = "th" if 11 <= day <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
-                formatted_ts = dt_obj.strftime(f"%a, {day}{suffix} %b '%y - %I:%M%p").lower()
-            except:
-                pass
-
-            parcel['tracking_history'].append({
+                if new_date or new_time:
+                    event_ts = canonical_event_timestamp(datetime.datetime.strptime(f"{new_date} {new_time}", "%Y-%m-%d %H:%M"))
+                else:
+                    event_ts = now_event_timestamp()
+            except ValueError:
+                flash('The tracking event needs both a valid date and time, or neither for now.')
+                return redirect(url_for('edit_parcel', id=id))
+
+            new_event = {
                 'status': new_status_header,
                 'subtext': request.form.get('new_subtext', ''),
                 'description': new_desc,
-                'location': request.form.get('new_location', parcel['current_location']),
-                'timestamp': formatted_ts
-            })
+                'location': request.form.get('new_location', changes['current_location']),
+                'timestamp': event_ts
+            }
             
-        save_parcels(parcels)
+        expected_version = request.form.get('version', type=int)
+        try:
+            if archived:
+                # The form was rendered from the archived copy, and restoring
+                # it (unless another edit already did) stamps a new version
+                if expected_version not in (None, parcel.get('version', 0)):
+                    raise VersionConflict(id, expected_version, parcel.get('version', 0))
+                restored = restore_parcel(parcel_store, parcel_archive, id)
+                if restored is None:
+                    raise VersionConflict(id, expected_version, (parcel_store.get(id) or {}).get('version', 0))
+                expected_version = restored.get('version', 0)
+            with parcel_store.batch():
+                parcel_store.update(id, changes, expected_version=expected_version)
+                if new_event:
+                    parcel_store.append_event(id, new_event)
+        except VersionConflict:
+            flash('This parcel was changed by someone else while you were editing. Review the latest details and save again.')
+            return redirect(url_for('edit_parcel', id=id))
         flash('Parcel Updated Successfully')
         return redirect(url_for('edit_parcel', id=id))
         
@@ -325,106 +941,228 @@ def edit_parcel(id):
 def handle_requests():
     if not session.get('admin'):
         return redirect('/login')
-    requests = load_change_requests()
-    parcels = load_parcels()
     if request.method == 'POST':
         action = request.form['action']
-        parcel_id = request.form['id']
+        request_ids = request.form.getlist('request_id')
+        if not request_ids and request.form.get('id'):
+            # Approve or reject everything queued for one parcel
+            request_ids = [r['request_id'] for r in change_request_store.for_parcel(request.form['id'])]
         if action == 'approve':
-            for parcel in parcels:
-                if parcel['id'] == parcel_id:
-                    for req in requests:
-                        if req['id'] == parcel_id:
-                            if req['new_address']:
-                                parcel['address'] = req['new_address']
-                            if req['new_phone']:
-                                parcel['phone'] = req['new_phone']
-                            if req['new_region']:
-                                parcel['region'] = req['new_region']
-            requests = [r for r in requests if r['id'] != parcel_id]
-            save_parcels(parcels)
-        elif action == 'reject':
-            requests = [r for r in requests if r['id'] != parcel_id]
-        save_change_requests(requests)
-        return redirect('/handle_requests')
-    return render_template('handle_requests.html', requests=requests, parcels=parcels)
+            results = process_change_requests(approve_ids=request_ids)
+        else:
+            results = process_change_requests(reject_ids=request_ids)
+        done = sum(1 for r in results.values() if r in ('approved', 'rejected'))
+        flash(f"{done} change request{'s' if done != 1 else ''} {'approved' if action == 'approve' else 'rejected'}.")
+        return redirect(url_for('handle_requests', page=request.args.get('page', 1, type=int)))
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    requests_total = change_request_store.count()
+    requests = change_request_store.page((page - 1) * REQUESTS_PAGE_SIZE, REQUESTS_PAGE_SIZE)
+    parcel_store.sync()
+    approval_ids, approvals_next = dashboard_index.page(
+        sort='last_event', cursor=request.args.get('approvals_cursor') or None,
+        limit=REQUESTS_PAGE_SIZE, filters={'status': ['Pending Approval']}
+    )
+    approvals = [p for p in (parcel_store.get(i) for i in approval_ids) if p]
+    return render_template('handle_requests.html', requests=requests, approvals=approvals,
+                           approvals_next=approvals_next, page=page, requests_total=requests_total,
+                           per_page=REQUESTS_PAGE_SIZE)
+
+# Batch Approve/Reject Change Requests API
+@app.route('/api/change_requests/batch', methods=['POST'])
+def change_requests_batch_api():
+    if not session.get('admin'):
+        return jsonify({'error': 'Login required'}), 401
+    data = request.get_json(silent=True) or {}
+    approve_ids = data.get('approve') or []
+    reject_ids = data.get('reject') or []
+    if not isinstance(approve_ids, list) or not isinstance(reject_ids, list):
+        return jsonify({'error': "'approve' and 'reject' must be lists of request IDs"}), 400
+    results = process_change_requests([str(i) for i in approve_ids], [str(i) for i in reject_ids])
+    return jsonify({
+        'results': results,
+        'approved': sum(1 for r in results.values() if r == 'approved'),
+        'rejected': sum(1 for r in results.values() if r == 'rejected')
+    })
+
+# Bulk Tracking Event Ingestion API
+@app.route('/api/events', methods=['POST'])
+def events_api():
+    token = app.config['INGEST_TOKEN']
+    if not session.get('admin') and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        return jsonify({'error': 'Not authorized'}), 401
+    ndjson = request.mimetype in ('application/x-ndjson', 'application/ndjson')
+    try:
+        raw_events = decode_events(request.get_data(), ndjson=ndjson)
+    except ValueError as e:
+        return jsonify({'error': f'Could not decode events: {e}'}), 400
+    if len(raw_events) > MAX_BATCH_EVENTS:
+        return jsonify({'error': f'At most {MAX_BATCH_EVENTS} events per batch'}), 413
+    results = ingest_events(parcel_store, raw_events)
+    accepted = sum(1 for r in results if r['ok'])
+    return jsonify({'accepted': accepted, 'rejected': len(results) - accepted, 'results': results})
+
+# Streaming Bulk Export API
+@app.route('/api/export')
+def export_api():
+    if not session.get('admin'):
+        return jsonify({'error': 'Login required'}), 401
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    history = request.args.get('history', '1' if fmt == 'ndjson' else '0') == '1'
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    body = export_parcels(parcel_store.iter_all(), fmt, history)
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=parcels.{fmt}'})
+
+# Streaming Bulk Import API, the body is read line by line
+@app.route('/api/import', methods=['POST'])
+def import_api():
+    if not session.get('admin'):
+        return jsonify({'error': 'Login required'}), 401
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    on_conflict = request.args.get('on_conflict', 'replace')
+    if fmt not in EXPORT_FORMATS or on_conflict not in ('replace', 'skip'):
+        return jsonify({'error': 'Unsupported format or on_conflict value'}), 400
+    stats = import_parcels(parcel_store, request.stream, fmt, on_conflict=on_conflict)
+    return jsonify(stats)
 
 # Print Label
 @app.route('/print_label/<id>')
 def print_label(id):
     if not session.get('admin'):
         return redirect('/login')
-    parcels = load_parcels()
-    parcel = next((p for p in parcels if p['id'] == id), None)
+    parcel = get_parcel(id)
     if not parcel:
         return "Parcel not found", 404
     return render_template('print_label.html', parcel=parcel, date=datetime.datetime.now().strftime("%Y-%m-%d"))
 
+# Batch Label Printing for dispatch waves.
+# Takes ?ids= (comma or whitespace separated, or repeated) or the dashboard
+# filters (status, region, payment_type, q) and streams one printable
+# document, rendered and sent a few labels at a time.
+MAX_BATCH_LABELS = 5000
+LABEL_STREAM_BUFFER = 200  # template fragments per chunk, roughly ten labels
+
+@app.route('/print_labels', methods=['GET', 'POST'])
+def print_labels():
+    if not session.get('admin'):
+        return redirect('/login')
+    args = request.values
+    wanted, error = select_parcel_ids(
+        [i for v in args.getlist('ids') for i in re.split(r'[\s,]+', v)],
+        {f: args.getlist(f) for f in ('status', 'region', 'payment_type')},
+        args.get('q', '').strip(), MAX_BATCH_LABELS
+    )
+    if error:
+        return error
+
+    # Which IDs exist comes from the in-memory index and the archive index,
+    # so the summary can go first; the labels are then read a chunk at a time
+    parcel_store.sync()
+    hot = set(dashboard_index.existing_ids(wanted))
+    archived = parcel_archive.existing_ids(i for i in wanted if i not in hot)
+    ids = [i for i in wanted if i in hot or i in archived]
+    found = set(ids)
+    context = {
+        'parcels': iter_parcels(ids),
+        'count': len(ids),
+        'missing': [i for i in wanted if i not in found],
+        'date': datetime.datetime.now().strftime("%Y-%m-%d")
+    }
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template('print_labels.html').stream(context)
+    stream.enable_buffering(LABEL_STREAM_BUFFER)
+    return Response(stream_with_context(stream), mimetype='text/html')
+
 # Logout
 @app.route('/logout')
 def logout():
     session.pop('admin', None)
     return redirect('/')
 
+# Chatbot replies by intent, see chatbot.py for how messages are matched
+CHAT_REPLIES = {
+    'greeting': "👋 Verified TrackSwift AI here! I can help you with:<br>1. 📦 Tracking a Parcel<br>2. 🚚 Scheduling a Pickup<br>3. 💰 Checking Rates<br>4. 📞 Customer Support",
+    'tracking': "To track your shipment, simply enter your **Tracking ID** (starting with TRK). or provide me the ID here.",
+    'shipping': "🚀 **Ready to ship?**<br>We offer fast and secure delivery.<br><br><a href='/create_parcel' class='chat-link' style='background: #ff6b6b; color: white; padding: 5px 10px; border-radius: 5px; text-decoration: none;'>Book a Parcel Now</a>",
+    'pricing': "💰 **Best Rates Guaranteed!**<br>Our pricing depends on weight and distance. You can get an instant quote on our <a href='/create_parcel' class='chat-link'>Booking Page</a>.",
+    'support': "📞 **We are here to help!**<br>You can reach our premium support line at:<br><strong>+91 96572 65104</strong><br><br>Or chat directly on WhatsApp:<br><a href='https://wa.me/919657265104?text=Hi%20TrackSwift%20Support,%20I%20need%20help' target='_blank' class='chat-link' style='color: #25D366; font-weight: bold;'>Click to Chat on WhatsApp 💬</a>",
+    'security': "🔒 **Top-Tier Security**<br>Every parcel is photo-verified at pickup and delivery. We use AI monitoring to ensure 100% safety.",
+    None: "🤖 I'm trained to help with logistics. Try asking about **tracking**, **shipping rates**, or **contacting support**."
+}
+
+# Helper function for the chatbot's answer about one parcel, reused while the parcel is unchanged
+def chat_parcel_reply(parcel, brief=False):
+    key = parcel_etag(parcel, 'chat', brief)
+    reply = page_cache.get(key)
+    if reply is None:
+        tracking_id = parcel['id']
+        history = parcel.get('tracking_history', [])
+        latest_status = history[-1]['status'] if history else parcel['status']
+        latest_loc = history[-1]['location'] if history else parcel['current_location']
+        if brief:
+            reply = f"<strong>{tracking_id}:</strong> {latest_status}, {latest_loc} <a href='/track?tracking_id={tracking_id}' class='chat-link'>Details</a>"
+        else:
+            reply = f"📦 **Parcel Found!**<br><strong>ID:</strong> {tracking_id}<br><strong>Status:</strong> {latest_status}<br><strong>Location:</strong> {latest_loc}<br><br><a href='/track?tracking_id={tracking_id}' class='chat-link'>View Full Details</a>"
+        page_cache.put(key, reply)
+    return reply
+
 # Helper function for Chatbot API
 @app.route('/api/chat', methods=['POST'])
 def chat_api():
-    data = request.get_json()
-    message = data.get('message', '').strip()
+    client = request.remote_addr or ''
+    if not chat_limiter.allow(client):
+        response = jsonify({'reply': "⏳ You're sending messages faster than I can answer. Please wait a moment and try again."})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(int(chat_limiter.retry_after(client)) + 1)
+        return response
+
+    data = request.get_json(silent=True) or {}
+    message = str(data.get('message', ''))[:MAX_MESSAGE_LENGTH].strip()
     
     if not message:
         return jsonify({'reply': "I didn't catch that. Could you say it again?"})
 
-    # Look for tracking ID in message
-    tracking_match = re.search(r'(TRK\d+)', message, re.IGNORECASE)
+    # Look for tracking IDs in message, all resolved in one lookup
+    tracking_ids, more = find_tracking_ids(message)
     
-    if tracking_match:
-        tracking_id = tracking_match.group(1).upper()
-        parcels = load_parcels()
-        parcel = next((p for p in parcels if p['id'] == tracking_id), None)
-        
-        if parcel:
-            history = parcel.get('tracking_history', [])
-            latest_status = history[-1]['status'] if history else parcel['status']
-            latest_loc = history[-1]['location'] if history else parcel['current_location']
-            
-            return jsonify({
-                'reply': f"📦 **Parcel Found!**<br><strong>ID:</strong> {tracking_id}<br><strong>Status:</strong> {latest_status}<br><strong>Location:</strong> {latest_loc}<br><br><a href='/track?tracking_id={tracking_id}' class='chat-link'>View Full Details</a>"
-            })
-        else:
-            return jsonify({'reply': f"❌ I verified our database, but I couldn't find any parcel with ID **{tracking_id}**. Please double-check the ID."})
-
-    # Intelligent Responses
-    msg_lower = message.lower()
-    
-    # Greetings
-    if any(x in msg_lower for x in ['hi', 'hello', 'hey', 'start']):
-        return jsonify({'reply': "👋 Verified TrackSwift AI here! I can help you with:<br>1. 📦 Tracking a Parcel<br>2. 🚚 Scheduling a Pickup<br>3. 💰 Checking Rates<br>4. 📞 Customer Support"})
+    if tracking_ids:
+        invalid = [i for i in tracking_ids if check_tracking_id(i) == 'invalid']
+        parcels = get_parcels([i for i in tracking_ids if i not in invalid])
+        # IDs are read upper-cased from the message; typed like /track, so
+        # parcels stored with another case are found too
+        for tracking_id in tracking_ids:
+            if tracking_id not in parcels and tracking_id not in invalid:
+                parcel = parcel_store.find(tracking_id) or parcel_archive.find(tracking_id)
+                if parcel:
+                    parcels[tracking_id] = parcel
 
-    # Tracking general
-    elif 'track' in msg_lower or 'where is' in msg_lower or 'status' in msg_lower:
-        return jsonify({'reply': "To track your shipment, simply enter your **Tracking ID** (starting with TRK). or provide me the ID here."})
-        
-    # Sending/Shipping
-    elif 'send' in msg_lower or 'ship' in msg_lower or 'courier' in msg_lower or 'new parcel' in msg_lower:
-        return jsonify({'reply': "🚀 **Ready to ship?**<br>We offer fast and secure delivery.<br><br><a href='/create_parcel' class='chat-link' style='background: #ff6b6b; color: white; padding: 5px 10px; border-radius: 5px; text-decoration: none;'>Book a Parcel Now</a>"})
-        
-    # Pricing/Rates
-    elif 'price' in msg_lower or 'cost' in msg_lower or 'rate' in msg_lower or 'how much' in msg_lower:
-        return jsonify({'reply': "💰 **Best Rates Guaranteed!**<br>Our pricing depends on weight and distance. You can get an instant quote on our <a href='/create_parcel' class='chat-link'>Booking Page</a>."})
-        
-    # Contact/Support
-    elif any(x in msg_lower for x in ['contact', 'human', 'support', 'call', 'talk', 'help']):
-        return jsonify({'reply': "📞 **We are here to help!**<br>You can reach our premium support line at:<br><strong>+91 96572 65104</strong><br><br>Or chat directly on WhatsApp:<br><a href='https://wa.me/919657265104?text=Hi%20TrackSwift%20Support,%20I%20need%20help' target='_blank' class='chat-link' style='color: #25D366; font-weight: bold;'>Click to Chat on WhatsApp 💬</a>"})
-
-    # Security
-    elif 'safe' in msg_lower or 'secure' in msg_lower or 'security' in msg_lower:
-        return jsonify({'reply': "🔒 **Top-Tier Security**<br>Every parcel is photo-verified at pickup and delivery. We use AI monitoring to ensure 100% safety."})
+        if len(tracking_ids) == 1:
+            tracking_id = tracking_ids[0]
+            if invalid:
+                return jsonify({'reply': f"❌ **{tracking_id}** doesn't look right, one of the digits seems mistyped. Please double-check the ID."})
+            if tracking_id in parcels:
+                return jsonify({'reply': chat_parcel_reply(parcels[tracking_id])})
+            return jsonify({'reply': f"❌ I verified our database, but I couldn't find any parcel with ID **{tracking_id}**. Please double-check the ID."})
 
-    # Default fallback
-    else:
-        return jsonify({'reply': "🤖 I'm trained to help with logistics. Try asking about **tracking**, **shipping rates**, or **contacting support**."})
+        # Combined summary, one line per ID in the order they were asked about
+        lines = []
+        for tracking_id in tracking_ids:
+            if tracking_id in parcels:
+                lines.append(chat_parcel_reply(parcels[tracking_id], brief=True))
+            elif tracking_id in invalid:
+                lines.append(f"❌ <strong>{tracking_id}:</strong> doesn't look right, one of the digits seems mistyped")
+            else:
+                lines.append(f"❌ <strong>{tracking_id}:</strong> no parcel found with this ID")
+        reply = f"📦 **Found {len(parcels)} of {len(tracking_ids)} parcels**<br>" + '<br>'.join(lines)
+        if more:
+            reply += f"<br><br>I can look up {MAX_IDS_PER_MESSAGE} IDs per message, please send the rest separately."
+        return jsonify({'reply': reply})
 
+    # Intelligent Responses
+    return jsonify({'reply': CHAT_REPLIES[match_intent(message)]})
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 3000))
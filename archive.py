@@ -0,0 +1,215 @@
+# Cold tier for delivered parcels.
+#
+# Parcels delivered longer ago than a configurable age are moved out of the
+# hot store into immutable, compressed segment files under data/archive/.
+# A segment is a series of gzip members, each holding a block of parcels as
+# NDJSON, so the whole file still reads with zcat but one lookup only
+# inflates one block. A small SQLite index maps every archived ID to its
+# segment, offset and length. Reads fall through to the archive when the hot
+# store has no such parcel.
+#
+# Segments are never rewritten, so the index records the schema version each
+# parcel was archived at and older blocks are upgraded as they are loaded.
+#
+#   python archive.py --older-than-days 30
+import argparse, datetime, functools, gzip, json, os, sqlite3, threading, time, uuid
+from timestamps import last_event_time
+from parcel_store import SCHEMA_VERSION
+
+BLOCK_PARCELS = 64
+SEGMENT_PARCELS = 5000
+
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS archived (
+    id TEXT PRIMARY KEY,
+    id_lower TEXT NOT NULL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    archived_at TEXT NOT NULL,
+    schema_version INTEGER NOT NULL DEFAULT 2
+);
+CREATE INDEX IF NOT EXISTS idx_archived_id_lower ON archived(id_lower);
+'''
+
+
+# Seconds since the epoch when the parcel last changed: updated_at if it has
+# one, else its latest tracking event, 0 when neither is known
+def last_change_time(parcel):
+    if parcel.get('updated_at'):
+        try:
+            return datetime.datetime.fromisoformat(parcel['updated_at']).timestamp()
+        except ValueError:
+            pass
+    return last_event_time(parcel)
+
+
+class ParcelArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.db')
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(self.index_path, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(INDEX_SCHEMA)
+            # Indexes created before versions were recorded, all at schema 2
+            if 'schema_version' not in {r[1] for r in conn.execute('PRAGMA table_info(archived)')}:
+                conn.execute('ALTER TABLE archived ADD COLUMN schema_version INTEGER NOT NULL DEFAULT 2')
+            self._local.conn = conn
+        return conn
+
+    # Segments never change, so decompressed blocks can be cached freely
+    @functools.lru_cache(maxsize=256)
+    def _block(self, segment, offset, length, version):
+        with open(os.path.join(self.directory, segment), 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        parcels = map(json.loads, data.splitlines())
+        if version < SCHEMA_VERSION:
+            from migrations import upgrade_parcel
+            parcels = (upgrade_parcel(p, version) for p in parcels)
+        return {p['id']: p for p in parcels}
+
+    def _load(self, row):
+        if row is None:
+            return None
+        parcel = self._block(*row[1:]).get(row[0])
+        # Callers may change what they get, never the cached block
+        return json.loads(json.dumps(parcel)) if parcel else None
+
+    def get(self, parcel_id):
+        if not os.path.exists(self.index_path):
+            return None
+        return self._load(self.conn.execute(
+            'SELECT id, segment, offset, length, schema_version FROM archived WHERE id = ?', (parcel_id,)).fetchone())
+
+    # Parcels for the archived IDs among `parcel_ids`, in the order given
+    def get_many(self, parcel_ids, chunk_size=500):
+        parcel_ids = list(parcel_ids)
+        if not parcel_ids or not os.path.exists(self.index_path):
+            return []
+        rows = {}
+        for start in range(0, len(parcel_ids), chunk_size):
+            chunk = parcel_ids[start:start + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            rows.update((r[0], r) for r in self.conn.execute(
+                f'SELECT id, segment, offset, length, schema_version FROM archived WHERE id IN ({placeholders})', chunk))
+        return [p for p in (self._load(rows.get(i)) for i in parcel_ids) if p]
+
+    # The archived IDs among `parcel_ids`, from the index alone
+    def existing_ids(self, parcel_ids, chunk_size=500):
+        parcel_ids = list(parcel_ids)
+        if not parcel_ids or not os.path.exists(self.index_path):
+            return set()
+        found = set()
+        for start in range(0, len(parcel_ids), chunk_size):
+            chunk = parcel_ids[start:start + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            found.update(r[0] for r in self.conn.execute(
+                f'SELECT id FROM archived WHERE id IN ({placeholders})', chunk))
+        return found
+
+    # Case-insensitive ID lookup, like ParcelStore.find
+    def find(self, query):
+        if not os.path.exists(self.index_path):
+            return None
+        return self._load(self.conn.execute(
+            'SELECT id, segment, offset, length, schema_version FROM archived WHERE id_lower = ?', (query.strip().lower(),)).fetchone())
+
+    def count(self):
+        if not os.path.exists(self.index_path):
+            return 0
+        return self.conn.execute('SELECT COUNT(*) FROM archived').fetchone()[0]
+
+    # Write parcels to a new segment and index them, returns the segment name.
+    # The index is updated only after the segment is complete on disk.
+    def write_segment(self, parcels):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.now(datetime.timezone.utc)
+        segment = f"segment-{stamp.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.ndjson.gz"
+        tmp_path = os.path.join(self.directory, segment + '.tmp')
+        rows = []
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, len(parcels), BLOCK_PARCELS):
+                block = parcels[start:start + BLOCK_PARCELS]
+                data = gzip.compress(''.join(json.dumps(p, ensure_ascii=False) + '\n' for p in block).encode('utf-8'))
+                offset = f.tell()
+                f.write(data)
+                rows.extend((p['id'], p['id'].lower(), segment, offset, len(data), stamp.isoformat(timespec='seconds'),
+                             SCHEMA_VERSION) for p in block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, segment))
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT OR REPLACE INTO archived VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return segment
+
+    # Forget an archived parcel, after it was restored to the hot store.
+    # Its copy stays in the immutable segment but is no longer reachable.
+    def forget(self, parcel_id):
+        if os.path.exists(self.index_path):
+            self.conn.execute('DELETE FROM archived WHERE id = ?', (parcel_id,))
+
+
+# Move delivered parcels that have not changed for `older_than_days` from the
+# store into new archive segments. Each segment is written and indexed before
+# its parcels leave the hot store, so a crash never loses a parcel.
+# Returns the number of parcels archived.
+def archive_delivered(store, archive, older_than_days, now=None, segment_size=SEGMENT_PARCELS):
+    cutoff = (now or time.time()) - older_than_days * 86400
+    # Unknown age (0) counts as old, like the seed data's fixed histories
+    candidates = [p['id'] for p in store.iter_all()
+                  if p.get('status') == 'Delivered' and last_change_time(p) < cutoff]
+    archived = 0
+    for start in range(0, len(candidates), segment_size):
+        with store.batch():
+            # Re-read under the batch so a parcel changed meanwhile stays hot
+            parcels = [p for p in (store.get(i) for i in candidates[start:start + segment_size])
+                       if p and p.get('status') == 'Delivered' and last_change_time(p) < cutoff]
+            if not parcels:
+                continue
+            archive.write_segment(parcels)
+            for p in parcels:
+                store.delete(p['id'])
+        archived += len(parcels)
+    return archived
+
+
+# Put an archived parcel back into the hot store so it can be edited
+def restore_parcel(store, archive, parcel_id):
+    parcel = archive.get(parcel_id)
+    if parcel is None:
+        return None
+    store.add(parcel)
+    archive.forget(parcel_id)
+    return store.get(parcel_id)
+
+
+if __name__ == "__main__":
+    from storage import open_stores, config_from_env
+
+    parser = argparse.ArgumentParser(description='Archive delivered parcels into compressed segments.')
+    parser.add_argument('--older-than-days', type=float,
+                        default=float(os.environ.get('TRACKSWIFT_ARCHIVE_AFTER_DAYS', 30)))
+    parser.add_argument('--segment-size', type=int, default=SEGMENT_PARCELS)
+    args = parser.parse_args()
+
+    data_dir = os.environ.get('TRACKSWIFT_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+    parcel_store, _ = open_stores(config_from_env(data_dir))
+    archive = ParcelArchive(os.path.join(data_dir, 'archive'))
+    count = archive_delivered(parcel_store, archive, args.older_than_days, segment_size=args.segment_size)
+    parcel_store.compact()
+    print(f'Archived {count} delivered parcels, {archive.count()} in the archive, '
+          f'{len(parcel_store.all())} active parcels left')
@@ -0,0 +1,66 @@
+# Compare two bench/run.py reports scenario by scenario.
+#
+#   python bench/compare.py bench/results/base.json bench/results/new.json --fail-above 10
+#
+# Exits with 1 when --fail-above is given and any scenario's p99 got slower,
+# or its throughput lower, by more than that many percent.
+import argparse, json, sys
+
+METRICS = (('throughput_rps', 'req/s', True), ('p50_ms', 'p50 ms', False),
+           ('p99_ms', 'p99 ms', False), ('peak_rss_mb', 'RSS MB', False))
+
+
+def change(base, new):
+    if base in (None, 0) or new is None:
+        return None
+    return (new - base) / base * 100
+
+
+# Percent changes where positive means worse
+def regressions(base, new):
+    worse = {}
+    for name, stats in new['scenarios'].items():
+        old = base['scenarios'].get(name)
+        if not old:
+            continue
+        p99 = change(old['p99_ms'], stats['p99_ms'])
+        rps = change(old['throughput_rps'], stats['throughput_rps'])
+        worse[name] = max(p99 or 0, -(rps or 0))
+    return worse
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare two benchmark reports.')
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--fail-above', type=float, help='allowed regression in percent')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    for key in ('mode', 'backend', 'workers', 'concurrency'):
+        if base.get(key) != new.get(key):
+            print(f'warning: {key} differs ({base.get(key)} vs {new.get(key)})')
+    if base['dataset']['parcels'] != new['dataset']['parcels']:
+        print(f"warning: dataset sizes differ ({base['dataset']['parcels']} vs {new['dataset']['parcels']})")
+    print(f"base {(base.get('commit') or '?')[:10]}  new {(new.get('commit') or '?')[:10]}")
+
+    header = f"{'scenario':16}" + ''.join(f' {label:>30}' for _, label, _ in METRICS)
+    print(header)
+    for name, stats in new['scenarios'].items():
+        old = base['scenarios'].get(name, {})
+        cells = []
+        for key, _, _ in METRICS:
+            pct = change(old.get(key), stats.get(key))
+            delta = f' ({pct:+.1f}%)' if pct is not None else ''
+            cells.append(' ' + f"{str(old.get(key, '-'))} -> {stats.get(key)}{delta}".rjust(30))
+        print(f'{name:16}' + ''.join(cells))
+
+    if args.fail_above is not None:
+        failed = {n: w for n, w in regressions(base, new).items() if w > args.fail_above}
+        for name, worse in failed.items():
+            print(f'REGRESSION {name}: {worse:.1f}% worse')
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,187 @@
+# Synthetic dataset generator for benchmarks.
+#
+# Builds parcels from the name, city, hub and courier tables in reset_data.py,
+# with a configurable number of parcels, tracking history lengths spread over
+# the last `days` days and a queue of pending change requests. Output is
+# deterministic for a given seed and is streamed, so millions of parcels never
+# sit in memory at once.
+#
+#   python bench/generate.py --parcels 100000 --requests 2000 --data-dir /tmp/bench-data
+#   python bench/generate.py --parcels 1000000 --backend sqlite --data-dir /tmp/bench-sqlite
+import argparse, datetime, json, os, random, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from reset_data import FIRST_NAMES, LAST_NAMES, LOCATIONS, LOGISTICS_PARTNERS
+from timestamps import canonical_event_timestamp
+from parcel_store import SCHEMA_VERSION
+
+STREETS = ['Green Apts', 'Sunshine Tower', 'Galaxy Heights', 'Palm Grove', 'Royal Enclave']
+PRICES = [499, 999, 1299, 2499, 5999]
+PAYMENT_TYPES = ['Prepaid', 'Postpaid', 'COD']
+# Share of parcels still waiting for admin approval
+PENDING_APPROVAL_SHARE = 0.02
+
+
+# Unique, evenly spread IDs: i * 7919 is a bijection modulo 10**9
+def parcel_id(i):
+    return f'TRK{(i * 7919 + 104729) % 10 ** 9:09d}'
+
+
+def _history(rng, origin, dest, addr, start_addr, length, started):
+    courier = rng.choice(LOGISTICS_PARTNERS)
+    stages = [
+        ('Order Confirmed', 'Online', 'Your Order has been placed.', f'Order ID #OD{rng.randint(1000000, 9999999)}'),
+        ('Picked Up', start_addr, 'Seller has handed over the package.', courier),
+        ('In Transit', f"{rng.choice(origin['hubs'])}, {origin['city']}", 'Arrived at Origin Facility', 'Processing'),
+        ('Shipped', f"{rng.choice(dest['hubs'])}, {dest['city']}", 'Arrived at Destination Hub', f'{courier} Facility'),
+        ('Out For Delivery', f"{dest['city']} Delivery Center", 'Your item is out for delivery',
+         f'Agent: {rng.choice(FIRST_NAMES)} ({rng.randint(7000000000, 9999999999)})'),
+        ('Delivered', addr, 'Your item has been delivered', 'Signed by: Receiver')
+    ]
+    # Histories longer than the six stages get extra hub scans while in transit
+    extra = max(length - len(stages), 0)
+    for _ in range(extra):
+        hub_city = rng.choice(LOCATIONS)
+        stages.insert(3, ('In Transit', f"{rng.choice(hub_city['hubs'])}, {hub_city['city']}",
+                          'Scanned at transit hub', courier))
+    when = started
+    events = []
+    for status, location, description, subtext in stages[:length]:
+        events.append({
+            'status': status,
+            'timestamp': canonical_event_timestamp(when),
+            'location': location,
+            'description': description,
+            'subtext': subtext
+        })
+        when += datetime.timedelta(minutes=rng.randint(30, 30 * 60))
+    return events
+
+
+# Yields `count` parcels. History lengths are uniform in [min_history, max_history].
+def generate_parcels(count, seed=1, min_history=1, max_history=8, days=60, now=None):
+    rng = random.Random(seed)
+    now = (now or datetime.datetime.now()).replace(second=0, microsecond=0)
+    for i in range(count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        sender = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        dest = rng.choice(LOCATIONS)
+        origin = rng.choice([l for l in LOCATIONS if l is not dest])
+        addr = f"Flat {rng.randint(1, 900)}, {rng.choice(STREETS)}, {dest['city']}, {dest['state']}"
+        start_addr = f"Main Warehouse, {origin['hubs'][0]}, {origin['city']}, {origin['state']}"
+        started = now - datetime.timedelta(minutes=rng.randint(0, days * 24 * 60))
+
+        if rng.random() < PENDING_APPROVAL_SHARE:
+            history = [{'status': 'Order Placed', 'location': 'Online', 'timestamp': canonical_event_timestamp(started)}]
+            status, current = 'Pending Approval', 'Sender Location'
+        else:
+            history = _history(rng, origin, dest, addr, start_addr, rng.randint(min_history, max_history), started)
+            status, current = history[-1]['status'], history[-1]['location']
+
+        yield {
+            'id': parcel_id(i),
+            'name': name,
+            'sender_name': sender,
+            'receiver_name': name,
+            'status': status,
+            'address': addr,
+            'start_address': start_addr,
+            'end_address': addr,
+            'price': f'₹ {rng.choice(PRICES)}',
+            'phone': f'+91 {rng.randint(7000000000, 9999999999)}',
+            'email': f"{name.lower().replace(' ', '.')}{i}@example.com",
+            'payment_type': rng.choice(PAYMENT_TYPES),
+            'region': 'Domestic',
+            'image': '',
+            'tracking_history': history,
+            'current_location': current
+        }
+
+
+def generate_change_requests(count, parcel_count, seed=1):
+    rng = random.Random(seed + 1)
+    base = datetime.datetime.now() - datetime.timedelta(days=1)
+    for n in range(count):
+        dest = rng.choice(LOCATIONS)
+        yield {
+            'id': parcel_id(rng.randrange(parcel_count)),
+            'request_id': f'bench{n:07d}',
+            'created_at': (base + datetime.timedelta(seconds=n)).isoformat(sep=' ', timespec='microseconds'),
+            'new_address': f"Flat {rng.randint(1, 900)}, {rng.choice(STREETS)}, {dest['city']}, {dest['state']}",
+            'new_phone': f'+91 {rng.randint(7000000000, 9999999999)}' if rng.random() < 0.5 else '',
+            'new_region': ''
+        }
+
+
+# Stream a data file in the stores' format ({"schema_version": N, key: [...]})
+# to disk one item at a time. Generated records already have every field.
+def _write_data_file(path, key, items):
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'{{"schema_version":{SCHEMA_VERSION},"{key}":[')
+        for item in items:
+            f.write(',\n' if count else '\n')
+            f.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+            count += 1
+        f.write('\n]}\n')
+    return count
+
+
+# Write a dataset into data_dir for the given backend, replacing what is there
+def write_dataset(data_dir, parcels, requests=0, backend='json', seed=1, min_history=1, max_history=8, days=60):
+    os.makedirs(data_dir, exist_ok=True)
+    parcel_file = os.path.join(data_dir, 'parcels.json')
+    requests_file = os.path.join(data_dir, 'change_requests.json')
+    for stale in ('parcels.journal', 'trackswift.db', 'trackswift.db-wal', 'trackswift.db-shm'):
+        if os.path.exists(os.path.join(data_dir, stale)):
+            os.remove(os.path.join(data_dir, stale))
+
+    rows = generate_parcels(parcels, seed, min_history, max_history, days)
+    queue = generate_change_requests(requests, parcels, seed)
+    if backend == 'json':
+        _write_data_file(parcel_file, 'parcels', rows)
+        _write_data_file(requests_file, 'change_requests', queue)
+        return
+
+    from sqlite_store import SqliteDatabase, SqliteParcelStore, SqliteChangeRequestStore
+    db = SqliteDatabase(os.path.join(data_dir, 'trackswift.db'))
+    parcel_store, request_store = SqliteParcelStore(db), SqliteChangeRequestStore(db)
+    chunk = []
+    for parcel in rows:
+        chunk.append(parcel)
+        if len(chunk) >= 5000:
+            with parcel_store.batch():
+                for p in chunk:
+                    parcel_store.add(p)
+            chunk = []
+    with parcel_store.batch():
+        for p in chunk:
+            parcel_store.add(p)
+        for r in queue:
+            request_store.add(r)
+    # The JSON files stay empty so nothing falls back to stale data
+    _write_data_file(parcel_file, 'parcels', [])
+    _write_data_file(requests_file, 'change_requests', [])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic TrackSwift dataset.')
+    parser.add_argument('--parcels', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=500, help='pending change requests')
+    parser.add_argument('--min-history', type=int, default=1)
+    parser.add_argument('--max-history', type=int, default=8)
+    parser.add_argument('--days', type=int, default=60, help='spread of order dates')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--data-dir', required=True, help='written in place, existing data is replaced')
+    args = parser.parse_args()
+
+    started = datetime.datetime.now()
+    write_dataset(args.data_dir, args.parcels, args.requests, args.backend, args.seed,
+                  args.min_history, args.max_history, args.days)
+    elapsed = (datetime.datetime.now() - started).total_seconds()
+    print(f'Wrote {args.parcels} parcels and {args.requests} change requests ({args.backend}) '
+          f'to {args.data_dir} in {elapsed:.1f}s')
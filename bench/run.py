@@ -0,0 +1,290 @@
+# Benchmark runner: drives the main routes against a generated dataset and
+# writes a JSON report of throughput, latency percentiles and peak RSS.
+#
+# --mode test runs the app in this process through the Flask test client, so
+# it measures route and storage cost without HTTP. --mode gunicorn starts a
+# local gunicorn with --workers and drives it over HTTP from --concurrency
+# threads. Compare two reports with bench/compare.py.
+#
+#   python bench/run.py --parcels 100000 --requests 200
+#   python bench/run.py --parcels 100000 --mode gunicorn --workers 4 --concurrency 8
+import argparse, datetime, json, math, os, platform, random, resource, subprocess, sys, tempfile, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.generate import write_dataset, parcel_id
+from reset_data import FIRST_NAMES, LAST_NAMES, LOCATIONS
+
+SCENARIOS = ('track_id', 'track_name', 'dashboard', 'api_parcels', 'api_chat',
+             'create_parcel', 'edit_parcel', 'handle_requests')
+# Statuses below this count as success (redirects included)
+OK_STATUS = 400
+
+
+# One request for the scenario: (method, path, form data, json body)
+def build_request(scenario, rng, parcels):
+    some_id = parcel_id(rng.randrange(parcels))
+    if scenario == 'track_id':
+        return 'GET', f'/track?tracking_id={some_id}', None, None
+    if scenario == 'track_name':
+        return 'GET', f'/track?tracking_id={rng.choice(FIRST_NAMES)}+{rng.choice(LAST_NAMES)}', None, None
+    if scenario == 'dashboard':
+        return 'GET', '/dashboard', None, None
+    if scenario == 'api_parcels':
+        return 'GET', '/api/parcels?limit=50&sort=last_event&order=desc', None, None
+    if scenario == 'api_chat':
+        return 'POST', '/api/chat', None, {'message': f'Where is my parcel {some_id}?'}
+    if scenario == 'create_parcel':
+        dest, origin = rng.sample(LOCATIONS, 2)
+        return 'POST', '/create_parcel', {
+            'sender_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'receiver_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'start_address': f"{origin['hubs'][0]}, {origin['city']}",
+            'end_address': f"Flat {rng.randint(1, 900)}, {dest['city']}, {dest['state']}",
+            'phone': f'+91 {rng.randint(7000000000, 9999999999)}',
+            'email': 'bench@example.com'
+        }, None
+    if scenario == 'edit_parcel':
+        city = rng.choice(LOCATIONS)
+        return 'POST', f'/edit_parcel/{some_id}', {
+            'status': 'In Transit',
+            'current_location': f"{rng.choice(city['hubs'])}, {city['city']}",
+            'start_address': 'Main Warehouse',
+            'end_address': f"{city['city']}, {city['state']}",
+            'new_status_header': 'In Transit',
+            'new_description': 'Benchmark scan',
+            'new_date': datetime.date.today().isoformat(),
+            'new_time': '10:00'
+        }, None
+    if scenario == 'handle_requests':
+        return 'GET', '/handle_requests', None, None
+    raise ValueError(f'Unknown scenario {scenario!r}')
+
+
+# Nearest-rank percentile
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)]
+
+
+def summarize(latencies, errors, wall):
+    values = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / wall, 2) if wall else None,
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 50)),
+        'p90_ms': ms(percentile(values, 90)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else None
+    }
+
+
+# In-process Flask test client, one request at a time
+class TestClientDriver:
+    def __init__(self):
+        import app as trackswift
+        self.client = trackswift.app.test_client()
+        with self.client.session_transaction() as s:
+            s['admin'] = True
+
+    def send(self, method, path, data, body):
+        response = self.client.open(path, method=method, data=data, json=body)
+        response.close()
+        return response.status_code
+
+    def run(self, requests, concurrency):
+        latencies, errors = [], 0
+        for request in requests:
+            start = time.perf_counter()
+            status = self.send(*request)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= OK_STATUS
+        return latencies, errors
+
+    def peak_rss_kb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def close(self):
+        pass
+
+
+# Local gunicorn, driven over HTTP by a pool of threads with their own sessions
+class GunicornDriver:
+    def __init__(self, workers, port, startup_timeout, env):
+        import requests
+        self.requests = requests
+        self.base = f'http://127.0.0.1:{port}'
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(workers),
+             '--bind', f'127.0.0.1:{port}', '--timeout', '600', '--log-level', 'warning'],
+            cwd=ROOT, env=env
+        )
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                if requests.get(self.base + '/', timeout=5).status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.close()
+                raise RuntimeError('gunicorn did not start')
+            time.sleep(0.25)
+
+    def _session(self):
+        session = self.requests.Session()
+        session.post(self.base + '/login', data={'username': 'admin', 'password': 'admin123'}, allow_redirects=False)
+        return session
+
+    def run(self, requests, concurrency):
+        latencies, errors = [], [0]
+        lock = threading.Lock()
+        queue = iter(requests)
+
+        def work():
+            session = self._session()
+            while True:
+                with lock:
+                    request = next(queue, None)
+                if request is None:
+                    return
+                method, path, data, body = request
+                start = time.perf_counter()
+                response = session.request(method, self.base + path, data=data, json=body, allow_redirects=False)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    errors[0] += response.status_code >= OK_STATUS
+
+        threads = [threading.Thread(target=work) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies, errors[0]
+
+    # Sum of each gunicorn process's own peak RSS (VmHWM), Linux only
+    def peak_rss_kb(self):
+        pids = [self.process.pid]
+        try:
+            with open(f'/proc/{self.process.pid}/task/{self.process.pid}/children') as f:
+                pids += [int(p) for p in f.read().split()]
+        except OSError:
+            return None
+        total = 0
+        for pid in pids:
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    total += next(int(l.split()[1]) for l in f if l.startswith('VmHWM:'))
+            except (OSError, StopIteration):
+                continue
+        return total
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the main routes and write a JSON report.')
+    parser.add_argument('--mode', choices=('test', 'gunicorn'), default='test')
+    parser.add_argument('--parcels', type=int, default=10000)
+    parser.add_argument('--change-requests', type=int, default=500)
+    parser.add_argument('--max-history', type=int, default=8)
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--data-dir', help='reuse a dataset from bench/generate.py with the same --parcels')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads in gunicorn mode')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--startup-timeout', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='report path (default: bench/results/<commit>-<mode>-<parcels>.json)')
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    for s in scenarios:
+        if s not in SCENARIOS:
+            parser.error(f'unknown scenario {s!r}, expected some of {", ".join(SCENARIOS)}')
+
+    data_dir = args.data_dir
+    generated_in = None
+    if not data_dir:
+        data_dir = tempfile.mkdtemp(prefix='trackswift-bench-')
+        started = time.perf_counter()
+        write_dataset(data_dir, args.parcels, args.change_requests, args.backend, args.seed, max_history=args.max_history)
+        generated_in = round(time.perf_counter() - started, 2)
+
+    env = dict(os.environ, TRACKSWIFT_DATA_DIR=data_dir, TRACKSWIFT_STORAGE=args.backend,
+               TRACKSWIFT_SQLITE_PATH=os.path.join(data_dir, 'trackswift.db'), TRACKSWIFT_GEOCODER='none',
+               # Every simulated client comes from one address, keep the chat rate limit out of the way
+               TRACKSWIFT_CHAT_BURST='1000000000')
+    started = time.perf_counter()
+    if args.mode == 'test':
+        os.environ.update(env)
+        driver = TestClientDriver()
+    else:
+        driver = GunicornDriver(args.workers, args.port, args.startup_timeout, env)
+    startup = round(time.perf_counter() - started, 2)
+
+    rng = random.Random(args.seed)
+    results = {}
+    try:
+        for scenario in scenarios:
+            driver.run([build_request(scenario, rng, args.parcels) for _ in range(args.warmup)], args.concurrency)
+            batch = [build_request(scenario, rng, args.parcels) for _ in range(args.requests)]
+            started = time.perf_counter()
+            latencies, errors = driver.run(batch, args.concurrency)
+            results[scenario] = summarize(latencies, errors, time.perf_counter() - started)
+            results[scenario]['peak_rss_mb'] = round((driver.peak_rss_kb() or 0) / 1024, 1)
+            print(f"{scenario:16} {results[scenario]['throughput_rps']:>9} req/s  "
+                  f"p50 {results[scenario]['p50_ms']:>9} ms  p99 {results[scenario]['p99_ms']:>9} ms  "
+                  f"errors {errors}")
+        peak_rss = driver.peak_rss_kb()
+    finally:
+        driver.close()
+
+    commit, dirty = git_revision()
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'mode': args.mode,
+        'backend': args.backend,
+        'workers': args.workers if args.mode == 'gunicorn' else 1,
+        'concurrency': args.concurrency if args.mode == 'gunicorn' else 1,
+        'dataset': {'parcels': args.parcels, 'change_requests': args.change_requests,
+                    'max_history': args.max_history, 'seed': args.seed, 'data_dir': data_dir,
+                    'generated_seconds': generated_in},
+        'startup_seconds': startup,
+        'peak_rss_mb': round((peak_rss or 0) / 1024, 1),
+        'scenarios': results
+    }
+    output = args.output or os.path.join(ROOT, 'bench', 'results',
+                                         f"{(commit or 'unknown')[:10]}-{args.mode}-{args.parcels}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Report written to {output}')
@@ -0,0 +1,141 @@
+# Multi-process stress check for the storage layer.
+#
+# Starts N worker processes, each importing the app on its own (like gunicorn
+# workers) against a scratch data directory, and has them hammer the write
+# endpoints at the same time: tracking events, change requests, and admin
+# edits that read the edit page, bump a counter kept in the current location
+# and save with the page's version, retrying on a conflict like an admin
+# would. Afterwards every write must be present exactly once.
+#
+#   python bench/stress_workers.py --workers 8 --iterations 200
+#   python bench/stress_workers.py --backend sqlite
+import argparse, multiprocessing, os, re, sys, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = 'stress-token'
+EDIT_RETRIES = 200
+CONFLICT_MESSAGE = 'changed by someone else'
+
+
+def _environment(data_dir, backend):
+    os.environ.update({
+        'TRACKSWIFT_DATA_DIR': data_dir,
+        'TRACKSWIFT_STORAGE': backend,
+        'TRACKSWIFT_SQLITE_PATH': os.path.join(data_dir, 'trackswift.db'),
+        'TRACKSWIFT_INGEST_TOKEN': TOKEN,
+        'TRACKSWIFT_GEOCODER': 'none',
+        # Compact often so journal folding races with appends
+        'TRACKSWIFT_JOURNAL_COMPACT_BYTES': str(64 * 1024)
+    })
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+
+def seed(data_dir, backend, parcels):
+    _environment(data_dir, backend)
+    from storage import open_stores, config_from_env
+    parcel_store, change_request_store = open_stores(config_from_env(data_dir))
+    parcel_store.save([{
+        'id': f'TRKSTRESS{i:04d}', 'sender_name': 'Stress Sender', 'receiver_name': f'Receiver {i}',
+        'status': 'In Transit', 'address': 'Hub', 'price': '0', 'start_address': 'Origin Hub',
+        'end_address': 'Destination Hub', 'current_location': 'Bay 0', 'tracking_history': []
+    } for i in range(parcels)])
+    change_request_store.save([])
+
+
+# Read the edit page, add one to the counter and save it with the page's
+# version and a tagged tracking event. Returns the number of conflicts.
+def edit_increment(client, parcel_id, tag):
+    for attempt in range(EDIT_RETRIES):
+        page = client.get(f'/edit_parcel/{parcel_id}').get_data(as_text=True)
+        version = re.search(r'name="version" value="(\d+)"', page).group(1)
+        counter = int(re.search(r'name="current_location" value="Bay (\d+)"', page).group(1))
+        r = client.post(f'/edit_parcel/{parcel_id}', data={
+            'version': version, 'status': 'In Transit', 'start_address': 'Origin Hub',
+            'end_address': 'Destination Hub', 'current_location': f'Bay {counter + 1}',
+            'new_status_header': 'Edited', 'new_description': tag
+        })
+        with client.session_transaction() as s:
+            flashes = s.pop('_flashes', [])
+        if r.status_code != 302:
+            raise RuntimeError(f'status {r.status_code}')
+        if not any(CONFLICT_MESSAGE in message for _, message in flashes):
+            return attempt
+    raise RuntimeError(f'still conflicting after {EDIT_RETRIES} attempts')
+
+
+def worker(number, data_dir, backend, parcels, iterations):
+    _environment(data_dir, backend)
+    import app as trackswift
+    client = trackswift.app.test_client()
+    with client.session_transaction() as s:
+        s['admin'] = True
+    failures = []
+    conflicts = 0
+    for i in range(iterations):
+        parcel_id = f'TRKSTRESS{(number + i) % parcels:04d}'
+        tag = f'w{number}-{i}'
+        r = client.post('/api/events', json=[{'id': parcel_id, 'status': 'Scanned', 'description': tag}],
+                        headers={'Authorization': f'Bearer {TOKEN}'})
+        if r.status_code != 200 or r.get_json()['accepted'] != 1:
+            failures.append(f'event {tag}: {r.status_code}')
+        r = client.post('/request_change', data={'id': parcel_id, 'new_phone': tag})
+        if r.status_code != 302:
+            failures.append(f'change request {tag}: {r.status_code}')
+        try:
+            conflicts += edit_increment(client, parcel_id, f'edit-{tag}')
+        except RuntimeError as e:
+            failures.append(f'edit {tag}: {e}')
+    return failures, conflicts
+
+
+def verify(data_dir, backend, workers, iterations):
+    _environment(data_dir, backend)
+    from storage import open_stores, config_from_env
+    parcel_store, change_request_store = open_stores(config_from_env(data_dir))
+    parcels = parcel_store.all()
+    expected = {f'w{n}-{i}' for n in range(workers) for i in range(iterations)}
+    problems = []
+
+    tags = [e.get('description') for p in parcels for e in p['tracking_history'] if e.get('status') == 'Scanned']
+    if len(tags) != len(expected) or set(tags) != expected:
+        problems.append(f'events: {len(set(tags) & expected)} of {len(expected)} present, {len(tags)} recorded')
+    edits = [e.get('description') for p in parcels for e in p['tracking_history'] if e.get('status') == 'Edited']
+    if len(edits) != len(expected) or set(edits) != {f'edit-{t}' for t in expected}:
+        problems.append(f'edit events: {len(edits)} recorded for {len(expected)} edits')
+    phones = [r.get('new_phone') for r in change_request_store.all()]
+    if len(phones) != len(expected) or set(phones) != expected:
+        problems.append(f'change requests: {len(set(phones) & expected)} of {len(expected)} present, {len(phones)} recorded')
+    counted = sum(int(p['current_location'].split()[-1]) for p in parcels)
+    if counted != len(expected):
+        problems.append(f'counter increments: {counted} of {len(expected)}')
+    versions = sum(p.get('version', 0) for p in parcels)
+    return problems, versions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Hammer the stores from several processes and check for lost writes.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--parcels', type=int, default=5, help='few parcels means many conflicts')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='trackswift-stress-')
+    seed(data_dir, args.backend, args.parcels)
+    # Fresh interpreters, so no worker inherits another's store state
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.workers) as pool:
+        results = pool.starmap(worker, [(n, data_dir, args.backend, args.parcels, args.iterations)
+                                        for n in range(args.workers)])
+    failures = [f for result, _ in results for f in result]
+    conflicts = sum(c for _, c in results)
+    problems, versions = verify(data_dir, args.backend, args.workers, args.iterations)
+
+    total = args.workers * args.iterations
+    print(f'{args.workers} workers x {args.iterations} iterations on {args.backend} in {data_dir}')
+    print(f'{total} events, {total} change requests, {total} counter edits ({conflicts} conflicts retried), '
+          f'final version sum {versions}')
+    for line in failures[:20] + problems:
+        print('FAIL', line)
+    sys.exit(1 if failures or problems else 0)
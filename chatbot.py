@@ -0,0 +1,96 @@
+# Message matching and rate limiting for the chat widget's /api/chat.
+#
+# The widget is on every page, so this is the busiest endpoint. Everything
+# here is built once at import: one pattern finds the tracking IDs in a
+# message, and one word-boundary pattern matches all intents, so "ship" and
+# "this" no longer count as a greeting. When a message matches several
+# intents the one listed first in INTENTS wins.
+import re, threading, time
+
+MAX_IDS_PER_MESSAGE = 10
+# Longer messages are cut before matching, no real question needs more
+MAX_MESSAGE_LENGTH = 2000
+
+TRACKING_ID_PATTERN = re.compile(r'\bTRK\d+\b', re.IGNORECASE)
+
+# (intent, keyword patterns), highest precedence first. A trailing \w* also
+# takes plurals and other endings ("shipping", "rates"); greetings are whole
+# words only. Specific questions outrank support, and a greeting only
+# answers a message that asks nothing else.
+INTENTS = (
+    ('tracking', (r'track\w*', r'where\s+is', r'status')),
+    ('pricing', (r'pric\w*', r'cost\w*', r'rates?', r'how\s+much', r'quote\w*')),
+    ('shipping', (r'send\w*', r'ship\w*', r'courier\w*', r'new\s+parcels?', r'book\w*')),
+    ('security', (r'safe\w*', r'secur\w*')),
+    ('support', (r'contact\w*', r'human', r'support\w*', r'call\w*', r'talk\w*', r'help\w*')),
+    ('greeting', (r'hi', r'hello', r'hey', r'start')),
+)
+
+INTENT_PATTERN = re.compile('|'.join(
+    rf"(?P<{name}>\b(?:{'|'.join(keywords)})\b)" for name, keywords in INTENTS), re.IGNORECASE)
+INTENT_RANK = {name: rank for rank, (name, _) in enumerate(INTENTS)}
+
+
+# Distinct tracking IDs in the order they appear, upper-cased. Returns
+# (ids, more) where more is True when the message had over `limit`.
+def find_tracking_ids(message, limit=MAX_IDS_PER_MESSAGE):
+    ids = []
+    for match in TRACKING_ID_PATTERN.finditer(message):
+        tracking_id = match.group(0).upper()
+        if tracking_id not in ids:
+            if len(ids) == limit:
+                return ids, True
+            ids.append(tracking_id)
+    return ids, False
+
+
+# Name of the highest-precedence intent in the message, or None
+def match_intent(message):
+    best = None
+    for match in INTENT_PATTERN.finditer(message):
+        if best is None or INTENT_RANK[match.lastgroup] < INTENT_RANK[best]:
+            best = match.lastgroup
+            if INTENT_RANK[best] == 0:
+                break
+    return best
+
+
+# Token bucket per client: `rate` requests per second on average, bursts of
+# up to `burst`. Per process, so with several gunicorn workers a client gets
+# that much from each. Idle clients are dropped once `max_clients` is reached.
+class RateLimiter:
+    def __init__(self, rate=1.0, burst=10, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    # True if the client may go ahead, False if it should back off
+    def allow(self, client, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if len(self._buckets) >= self.max_clients:
+                self._prune(now)
+            allowed = tokens >= 1
+            self._buckets[client] = (tokens - 1 if allowed else tokens, now)
+            return allowed
+
+    # Seconds until the client has a token again
+    def retry_after(self, client, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(client, (self.burst, now))
+        return max(0.0, (1 - tokens) / self.rate - (now - last))
+
+    # Forget clients whose buckets have refilled, then the longest idle ones
+    # until a tenth of the room is free. Called with the lock held.
+    def _prune(self, now):
+        for client in [c for c, (tokens, last) in self._buckets.items()
+                       if tokens + (now - last) * self.rate >= self.burst]:
+            del self._buckets[client]
+        # Dicts keep insertion order and allow() re-inserts, so the first are the most idle
+        while len(self._buckets) > self.max_clients * 9 // 10:
+            del self._buckets[next(iter(self._buckets))]
@@ -0,0 +1,186 @@
+# Sorted and faceted view of the parcels for the paginated dashboard API.
+#
+# Keeps every parcel ID in a list sorted by ID and another sorted by the time
+# of its latest tracking event, plus ID sets per status, region and payment
+# type. A page is read by bisecting to the cursor and walking forward, so its
+# cost depends on the page size and the filter selectivity, not on the
+# number of parcels. Registered as a store listener like the search index.
+import base64, bisect, json, threading
+from timestamps import last_event_time
+
+SORTS = ('id', 'last_event')
+SORT_KEY_TYPES = {'id': (str,), 'last_event': ((int, float), str)}
+FACETS = ('status', 'region', 'payment_type')
+
+# Below this many candidates it is cheaper to sort them than to walk the list
+SMALL_CANDIDATE_SET = 2000
+
+
+# Cursors are the sort name plus the sort key of the last row, base64 encoded
+def encode_cursor(sort, key):
+    return base64.urlsafe_b64encode(json.dumps([sort] + list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(sort, cursor):
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(value, list) or not value or value[0] != sort:
+        raise ValueError('Cursor does not belong to this sort order')
+    key = tuple(value[1:])
+    if len(key) != len(SORT_KEY_TYPES[sort]) or not all(isinstance(k, t) for k, t in zip(key, SORT_KEY_TYPES[sort])):
+        raise ValueError('Invalid cursor')
+    return key
+
+
+class DashboardIndex:
+    def __init__(self, search_index=None):
+        self.search_index = search_index
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._sorted = {s: [] for s in SORTS}
+        self._facets = {f: {} for f in FACETS}
+
+    def _sort_keys(self, parcel):
+        return {'id': (parcel['id'],), 'last_event': (last_event_time(parcel), parcel['id'])}
+
+    def _facet_values(self, parcel):
+        return {f: str(parcel.get(f) or '').lower() for f in FACETS}
+
+    def _add(self, parcel_id, parcel, insort=True):
+        keys = self._sort_keys(parcel)
+        facets = self._facet_values(parcel)
+        self._keys[parcel_id] = (keys, facets)
+        for sort, key in keys.items():
+            if insort:
+                bisect.insort(self._sorted[sort], key)
+            else:
+                self._sorted[sort].append(key)
+        for facet, value in facets.items():
+            self._facets[facet].setdefault(value, set()).add(parcel_id)
+
+    def _remove(self, parcel_id):
+        entry = self._keys.pop(parcel_id, None)
+        if entry is None:
+            return
+        keys, facets = entry
+        for sort, key in keys.items():
+            items = self._sorted[sort]
+            i = bisect.bisect_left(items, key)
+            if i < len(items) and items[i] == key:
+                del items[i]
+        for facet, value in facets.items():
+            ids = self._facets[facet].get(value)
+            if ids is not None:
+                ids.discard(parcel_id)
+                if not ids:
+                    del self._facets[facet][value]
+
+    # Store listener hooks
+    def reset(self, parcels):
+        with self._lock:
+            self._keys = {}
+            self._sorted = {s: [] for s in SORTS}
+            self._facets = {f: {} for f in FACETS}
+            for p in parcels:
+                self._add(p['id'], p, insort=False)
+            for items in self._sorted.values():
+                items.sort()
+
+    def apply(self, parcel_id, parcel):
+        with self._lock:
+            self._remove(parcel_id)
+            if parcel is not None:
+                self._add(parcel_id, parcel)
+
+    # The given IDs that are in the index, in the same order
+    def existing_ids(self, parcel_ids):
+        with self._lock:
+            return [i for i in parcel_ids if i in self._keys]
+
+    # Accepted lowercased values per facet, only for facets that are filtered
+    def _facet_filters(self, filters):
+        return {f: {v.lower() for v in filters[f]} for f in FACETS if filters.get(f)}
+
+    # A small enough set of IDs to sort directly, or None to walk the sorted list
+    def _candidates(self, facet_filters, query):
+        sets = []
+        for facet, values in facet_filters.items():
+            index = self._facets[facet]
+            size = sum(len(index.get(v, ())) for v in values)
+            if size <= SMALL_CANDIDATE_SET:
+                sets.append(set().union(*(index.get(v, set()) for v in values)))
+        if query and self._query_is_narrow(query):
+            sets.append(self._query_ids(query))
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    def _query_is_narrow(self, query):
+        return self.search_index is None or self.search_index.estimate(query) <= SMALL_CANDIDATE_SET
+
+    # Parcels matching the text query by name/phone/email, or by tracking ID prefix
+    def _query_ids(self, query):
+        matched = self.search_index.matching_ids(query) if self.search_index else set()
+        prefix = query.strip().upper()
+        items = self._sorted['id']
+        i = bisect.bisect_left(items, (prefix,))
+        while i < len(items) and items[i][0].startswith(prefix):
+            matched.add(items[i][0])
+            i += 1
+        return matched
+
+    def _query_matches(self, parcel_id, query):
+        if parcel_id.upper().startswith(query.strip().upper()):
+            return True
+        return self.search_index is not None and self.search_index.matches(parcel_id, query)
+
+    # One page of parcel IDs plus the cursor for the next page (None at the end).
+    # filters maps status / region / payment_type to lists of accepted values,
+    # and exclude_status to a list of statuses to leave out.
+    def page(self, sort='id', order='asc', cursor=None, limit=50, filters=None, query=None):
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort {sort!r}")
+        filters = filters or {}
+        facet_filters = self._facet_filters(filters)
+        excluded = {s.lower() for s in filters.get('exclude_status') or ()}
+        after = decode_cursor(sort, cursor) if cursor else None
+        descending = order == 'desc'
+
+        with self._lock:
+            candidates = self._candidates(facet_filters, query)
+            # Broad text queries are checked row by row while walking instead
+            scan_query = query if query and not self._query_is_narrow(query) else None
+
+            def wanted(parcel_id):
+                facets = self._keys[parcel_id][1]
+                if facets['status'] in excluded:
+                    return False
+                if not all(facets[f] in values for f, values in facet_filters.items()):
+                    return False
+                return scan_query is None or self._query_matches(parcel_id, scan_query)
+
+            if candidates is not None:
+                items = sorted(self._keys[i][0][sort] for i in candidates if i in self._keys)
+            else:
+                items = self._sorted[sort]
+
+            if descending:
+                start = bisect.bisect_left(items, after) - 1 if after else len(items) - 1
+                positions = range(start, -1, -1)
+            else:
+                start = bisect.bisect_right(items, after) if after else 0
+                positions = range(start, len(items))
+
+            page_keys = []
+            for i in positions:
+                key = items[i]
+                if wanted(key[-1]):
+                    page_keys.append(key)
+                    if len(page_keys) > limit:
+                        break
+
+        next_cursor = encode_cursor(sort, page_keys[limit - 1]) if len(page_keys) > limit else None
+        return [key[-1] for key in page_keys[:limit]], next_cursor
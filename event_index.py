@@ -0,0 +1,220 @@
+# Time-ordered index of tracking events for the ops queries.
+#
+# Registered as a store listener like the dashboard index, so it follows
+# every write. It keeps three sorted views, each answered by bisecting
+# instead of walking the parcels and parsing their timestamps:
+#
+#   - events per location, by time: "what was scanned at hub X in the last hour"
+#   - parcels per status, by the time of their latest event: "what has been
+#     sitting in the same status for more than N hours"
+#   - transit times per lane (origin city to destination city) of delivered
+#     parcels: percentiles per lane
+#
+# Canonical event timestamps (see timestamps.py) sort as strings, so they
+# are indexed as they are stored and only parsed to compute transit times
+# and ages of the rows returned. Events without one are left out.
+import bisect, datetime, functools, heapq, itertools, math, threading
+from geocoder import normalize_address
+from timestamps import parse_event_timestamp, canonical_event_timestamp, to_epoch
+
+# Statuses a parcel is expected to stay in, not counted as stuck unless asked for
+FINAL_STATUSES = ('Delivered',)
+
+
+# City of an address for lane grouping: the part before the state when the
+# address has three or more comma parts ("Flat 7, Palm Grove, Bangalore,
+# Karnataka"), else the last part ("Madhapur, Hyderabad")
+def address_city(address):
+    parts = [p for p in normalize_address(address).split(', ') if p]
+    if not parts:
+        return None
+    return (parts[-2] if len(parts) >= 3 else parts[-1]).title()
+
+
+# Most events are at a few hundred hubs, so their keys repeat
+_location_key = functools.lru_cache(maxsize=65536)(normalize_address)
+
+
+def _canonical(timestamp):
+    return isinstance(timestamp, str) and len(timestamp) == 19 and timestamp[10] == 'T'
+
+
+def _epoch(timestamp):
+    return to_epoch(parse_event_timestamp(timestamp))
+
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, pct):
+    rank = max(1, math.ceil(len(values) * pct / 100))
+    return values[min(rank, len(values)) - 1]
+
+
+class EventIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._by_location = {}
+        self._location_parts = {}
+        self._by_status = {}
+        self._lanes = {}
+
+    # (event entries, (status, since) or None, (lane, transit seconds) or None).
+    # An event entry is (timestamp, parcel ID, position, status, location).
+    def _index_entries(self, parcel_id, parcel):
+        events = []
+        first = last = delivered = None
+        for seq, event in enumerate(parcel.get('tracking_history') or []):
+            when = event.get('timestamp')
+            if not _canonical(when):
+                continue
+            if first is None:
+                first = when
+            last = when
+            if _location_key(event.get('location')):
+                events.append((when, parcel_id, seq, event.get('status') or '', event.get('location')))
+            if str(event.get('status') or '').lower() == 'delivered':
+                delivered = when
+        since = (str(parcel.get('status') or ''), (last, parcel_id)) if last is not None else None
+        lane = None
+        if parcel.get('status') == 'Delivered' and delivered is not None and delivered >= first:
+            origin, destination = address_city(parcel.get('start_address')), address_city(parcel.get('end_address'))
+            if origin and destination:
+                lane = ((origin, destination), int(_epoch(delivered) - _epoch(first)))
+        return tuple(events), since, lane
+
+    def _add_event(self, entry, insort=True):
+        location = _location_key(entry[4])
+        if location not in self._by_location:
+            self._by_location[location] = []
+            for part in set(location.split(', ')):
+                self._location_parts.setdefault(part, set()).add(location)
+        if insort:
+            bisect.insort(self._by_location[location], entry)
+        else:
+            self._by_location[location].append(entry)
+
+    def _remove_event(self, entry):
+        location = _location_key(entry[4])
+        entries = self._by_location[location]
+        del entries[bisect.bisect_left(entries, entry)]
+        if not entries:
+            del self._by_location[location]
+            for part in set(location.split(', ')):
+                self._location_parts[part].discard(location)
+                if not self._location_parts[part]:
+                    del self._location_parts[part]
+
+    def _add(self, parcel_id, parcel, insort=True):
+        events, since, lane = self._index_entries(parcel_id, parcel)
+        self._entries[parcel_id] = (events, since, lane)
+        add = bisect.insort if insort else list.append
+        for entry in events:
+            self._add_event(entry, insort)
+        if since:
+            add(self._by_status.setdefault(since[0], []), since[1])
+        if lane:
+            add(self._lanes.setdefault(lane[0], []), lane[1])
+
+    # Store listener hooks
+    def reset(self, parcels):
+        with self._lock:
+            self._entries = {}
+            self._by_location = {}
+            self._location_parts = {}
+            self._by_status = {}
+            self._lanes = {}
+            for p in parcels:
+                self._add(p['id'], p, insort=False)
+            for entries in (self._by_location, self._by_status, self._lanes):
+                for values in entries.values():
+                    values.sort()
+
+    def apply(self, parcel_id, parcel):
+        with self._lock:
+            old_events, old_since, old_lane = self._entries.pop(parcel_id, ((), None, None))
+            events, since, lane = self._index_entries(parcel_id, parcel) if parcel is not None else ((), None, None)
+            # Usually one event was appended, so only the difference is moved
+            for entry in set(old_events).difference(events):
+                self._remove_event(entry)
+            for entry in set(events).difference(old_events):
+                self._add_event(entry)
+            if old_since != since:
+                if old_since:
+                    self._remove_sorted(self._by_status, *old_since)
+                if since:
+                    bisect.insort(self._by_status.setdefault(since[0], []), since[1])
+            if old_lane != lane:
+                if old_lane:
+                    self._remove_sorted(self._lanes, *old_lane)
+                if lane:
+                    bisect.insort(self._lanes.setdefault(lane[0], []), lane[1])
+            if parcel is not None:
+                self._entries[parcel_id] = (events, since, lane)
+
+    def _remove_sorted(self, groups, key, value):
+        values = groups[key]
+        del values[bisect.bisect_left(values, value)]
+        if not values:
+            del groups[key]
+
+    # Events at a location between two canonical timestamps (until
+    # exclusive), oldest first. `hub` matches a whole location ("Bhiwandi
+    # Hub, Mumbai") or any one comma part of it ("Bhiwandi Hub", "Mumbai"),
+    # case-insensitively. Returns (events, total) with at most `limit` events.
+    def events_at(self, hub, since, until=None, limit=1000):
+        hub = normalize_address(hub)
+        with self._lock:
+            locations = set(self._location_parts.get(hub, ()))
+            if hub in self._by_location:
+                locations.add(hub)
+            ranges = []
+            for location in locations:
+                entries = self._by_location[location]
+                start = bisect.bisect_left(entries, (since,))
+                end = len(entries) if until is None else bisect.bisect_left(entries, (until,))
+                if end > start:
+                    ranges.append(entries[start:end])
+        total = sum(len(r) for r in ranges)
+        return [{'id': parcel_id, 'status': status, 'location': location, 'timestamp': when}
+                for when, parcel_id, _, status, location in itertools.islice(heapq.merge(*ranges), limit)], total
+
+    # Parcels whose latest event is more than `hours` before `now` (a
+    # canonical timestamp), in their current status, longest waiting first.
+    # Final statuses are skipped unless named. Returns (parcels, total) with
+    # at most `limit` parcels.
+    def stuck(self, hours, now, statuses=None, limit=1000):
+        now_epoch = _epoch(now)
+        before = canonical_event_timestamp(datetime.datetime.fromisoformat(now) - datetime.timedelta(hours=hours))
+        with self._lock:
+            if statuses:
+                groups = {s: self._by_status[s] for s in statuses if s in self._by_status}
+            else:
+                groups = {s: v for s, v in self._by_status.items() if s not in FINAL_STATUSES}
+            total = 0
+            ranges = []
+            for status, entries in groups.items():
+                end = bisect.bisect_left(entries, (before,))
+                total += end
+                # Only the first `limit` of each status can make the page
+                ranges.append([(since, parcel_id, status) for since, parcel_id in entries[:min(end, limit)]])
+        return [{'id': parcel_id, 'status': status, 'since': since, 'hours': round((now_epoch - _epoch(since)) / 3600, 1)}
+                for since, parcel_id, status in itertools.islice(heapq.merge(*ranges), limit)], total
+
+    # Transit time percentiles in hours for each lane with at least
+    # `min_count` delivered parcels, optionally one origin or destination city
+    def lane_percentiles(self, percentiles=(50, 90, 99), origin=None, destination=None, min_count=1):
+        origin = origin.strip().title() if origin else None
+        destination = destination.strip().title() if destination else None
+        with self._lock:
+            lanes = []
+            for (lane_origin, lane_destination), transits in self._lanes.items():
+                if (origin and lane_origin != origin) or (destination and lane_destination != destination):
+                    continue
+                if len(transits) < min_count:
+                    continue
+                lane = {'origin': lane_origin, 'destination': lane_destination, 'count': len(transits)}
+                for pct in percentiles:
+                    lane[f'p{pct:g}_hours'] = round(percentile(transits, pct) / 3600, 1)
+                lanes.append(lane)
+        lanes.sort(key=lambda l: (-l['count'], l['origin'], l['destination']))
+        return lanes
@@ -0,0 +1,60 @@
+# Inter-process lock on a file next to the data, so several gunicorn workers
+# can share the JSON stores.
+#
+# Writers hold the exclusive lock across refresh -> apply -> write, so every
+# process appends to the journal on top of the latest state. Readers take the
+# shared lock only while they re-read changed files. The lock is reentrant
+# within a process: a shared request inside an exclusive hold is a no-op.
+# On platforms without fcntl it degrades to a process-local lock.
+import os, threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+        self._exclusive = False
+
+    def _flock(self, operation):
+        if fcntl is None:
+            return
+        # A descriptor inherited across fork shares its lock with the parent
+        if self._fd is None or self._pid != os.getpid():
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        fcntl.flock(self._fd, getattr(fcntl, operation))
+
+    @contextmanager
+    def _hold(self, exclusive):
+        with self._lock:
+            if self._depth and exclusive and not self._exclusive:
+                raise RuntimeError('Cannot upgrade a shared lock to an exclusive one')
+            if self._depth == 0:
+                self._flock('LOCK_EX' if exclusive else 'LOCK_SH')
+                self._exclusive = exclusive
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._flock('LOCK_UN')
+                    self._exclusive = False
+
+    def exclusive(self):
+        return self._hold(True)
+
+    def shared(self):
+        return self._hold(False)
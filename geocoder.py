@@ -0,0 +1,197 @@
+# Server-side geocoding for the parcel map.
+#
+# Addresses are resolved in order from an in-memory LRU, a persistent
+# on-disk cache shared by all workers, the offline gazetteer of the cities
+# and hubs we operate in, and finally an upstream provider. Every upstream
+# answer (including "not found") is appended to the disk cache, so each
+# distinct address reaches the provider at most once per deployment. The
+# disk cache stops growing at `max_disk_entries`; later answers are only
+# kept in the LRU.
+import json, os, re, threading, time
+from collections import OrderedDict
+
+# Retry addresses the provider could not find after this long
+NEGATIVE_TTL = 7 * 24 * 3600
+
+
+def normalize_address(address):
+    parts = (' '.join(p.split()) for p in str(address or '').lower().split(','))
+    return ', '.join(p for p in parts if p)
+
+
+def _pattern(name):
+    return re.compile(r'\b' + re.escape(name.lower()) + r'\b')
+
+
+# Offline lookup by city and hub name, built from data/gazetteer.json
+class Gazetteer:
+    def __init__(self, path):
+        self.cities = []
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for city in data.get('cities', []):
+                names = [city['name']] + city.get('aliases', [])
+                hubs = [(_pattern(hub), tuple(coords)) for hub, coords in city.get('hubs', {}).items()]
+                self.cities.append(([_pattern(n) for n in names], tuple(city['coords']), hubs))
+
+    # (lat, lon) of the most specific known place in the address, or None.
+    # The city is taken from the last comma part that names one, then a hub
+    # of that city anywhere in the address wins over the city centre.
+    def lookup(self, address):
+        parts = normalize_address(address).split(', ')
+        for part in reversed(parts):
+            for patterns, coords, hubs in self.cities:
+                if any(p.search(part) for p in patterns):
+                    for hub, hub_coords in hubs:
+                        if any(hub.search(p) for p in parts):
+                            return hub_coords
+                    return coords
+        return None
+
+
+# Upstream provider backed by OpenStreetMap Nominatim. Calls are serialised
+# and spaced out to respect its one-request-per-second usage policy.
+class NominatimProvider:
+    URL = 'https://nominatim.openstreetmap.org/search'
+
+    def __init__(self, user_agent='TrackSwift/1.0', min_interval=1.0, timeout=5):
+        self.user_agent = user_agent
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._last_call = 0.0
+
+    # (lat, lon), or None when nothing matched. Network errors raise.
+    def geocode(self, address):
+        import requests
+        with self._lock:
+            wait = self._last_call + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                response = requests.get(self.URL, params={'format': 'json', 'limit': 1, 'q': address},
+                                        headers={'User-Agent': self.user_agent}, timeout=self.timeout)
+            finally:
+                self._last_call = time.monotonic()
+        response.raise_for_status()
+        results = response.json()
+        if not results:
+            return None
+        return float(results[0]['lat']), float(results[0]['lon'])
+
+
+# Fixed answers, for tests and offline deployments
+class StaticProvider:
+    def __init__(self, answers=None):
+        self.answers = {normalize_address(k): tuple(v) for k, v in (answers or {}).items()}
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        return self.answers.get(normalize_address(address))
+
+
+class LRUCache:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+class Geocoder:
+    def __init__(self, cache_path, gazetteer_path, provider=None, lru_size=4096, max_disk_entries=100000):
+        self.cache_path = cache_path
+        self.max_disk_entries = max_disk_entries
+        self.gazetteer = Gazetteer(gazetteer_path)
+        self.provider = provider
+        self.lru = LRUCache(lru_size)
+        self._lock = threading.Lock()
+        self._disk = {}
+        self._offset = 0
+
+    # Read cache lines appended since the last call, by this or another worker
+    def _refresh(self):
+        if not os.path.exists(self.cache_path):
+            return
+        if os.path.getsize(self.cache_path) < self._offset:
+            self._disk, self._offset = {}, 0
+        with open(self.cache_path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                self._offset += len(line)
+                try:
+                    entry = json.loads(line)
+                    self._disk[entry['q']] = entry
+                except (ValueError, KeyError):
+                    continue
+
+    def _store(self, key, coords):
+        if key not in self._disk and len(self._disk) >= self.max_disk_entries:
+            return
+        entry = {'q': key, 'coords': list(coords) if coords else None, 'at': int(time.time())}
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with open(self.cache_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+        self._disk[key] = entry
+
+    # {'lat', 'lon', 'source'} or None. With upstream=False only the caches
+    # and the gazetteer are consulted, so the call never blocks on the network.
+    def resolve(self, address, upstream=True):
+        key = normalize_address(address)
+        if not key:
+            return None
+        hit = self.lru.get(key)
+        if hit is not None:
+            return dict(hit, source='cache')
+
+        with self._lock:
+            self._refresh()
+            entry = self._disk.get(key)
+        if entry is not None and entry['coords']:
+            result = {'lat': entry['coords'][0], 'lon': entry['coords'][1]}
+            self.lru.put(key, result)
+            return dict(result, source='cache')
+
+        coords = self.gazetteer.lookup(key)
+        if coords:
+            result = {'lat': coords[0], 'lon': coords[1]}
+            self.lru.put(key, result)
+            return dict(result, source='gazetteer')
+
+        recently_missed = entry is not None and time.time() - entry.get('at', 0) < NEGATIVE_TTL
+        if not upstream or self.provider is None or recently_missed:
+            return None
+        coords = self.provider.geocode(address)
+        with self._lock:
+            self._store(key, coords)
+        if not coords:
+            return None
+        result = {'lat': coords[0], 'lon': coords[1]}
+        self.lru.put(key, result)
+        return dict(result, source='upstream')
+
+
+# GEOCODER_PROVIDER is 'nominatim' or 'none' (caches and gazetteer only)
+def make_provider(name, user_agent='TrackSwift/1.0'):
+    if name == 'nominatim':
+        return NominatimProvider(user_agent)
+    if name == 'none':
+        return None
+    raise ValueError(f"Unknown geocoder provider {name!r}, expected 'nominatim' or 'none'")
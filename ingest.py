@@ -0,0 +1,106 @@
+# Bulk tracking-event ingestion for hub scanners.
+#
+# A batch is validated event by event, grouped by parcel and written with a
+# single store batch, so 10k scans cost one journal append (or one SQLite
+# transaction) instead of 10k full rewrites.
+import datetime, json
+from timestamps import parse_event_timestamp, canonical_event_timestamp
+
+EVENT_FIELDS = ('id', 'status', 'location', 'description', 'subtext', 'timestamp')
+MAX_BATCH_EVENTS = 50000
+
+
+# Decode a request body holding a JSON array or NDJSON (one object per line).
+# Returns a list where undecodable NDJSON lines are kept as ValueError items.
+def decode_events(body, ndjson=False):
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    if not ndjson and text.lstrip().startswith('['):
+        events = json.loads(text)
+        if not isinstance(events, list):
+            raise ValueError('Expected a JSON array of events')
+        return events
+    events = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            events.append(ValueError(f'Line {number} is not valid JSON'))
+    return events
+
+
+# Returns (parcel_id, event, when) or raises ValueError with the reason
+def validate_event(raw, store):
+    if isinstance(raw, Exception):
+        raise raw
+    if not isinstance(raw, dict):
+        raise ValueError('Event must be an object')
+    unknown = set(raw) - set(EVENT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    parcel_id = str(raw.get('id') or '').strip()
+    status = str(raw.get('status') or '').strip()
+    if not parcel_id:
+        raise ValueError("Missing 'id'")
+    if not status:
+        raise ValueError("Missing 'status'")
+    if store.get(parcel_id) is None:
+        raise ValueError(f'Parcel {parcel_id} not found')
+
+    if raw.get('timestamp'):
+        when = parse_event_timestamp(str(raw['timestamp']))
+        if when is None:
+            raise ValueError(f"Unrecognised timestamp {raw['timestamp']!r}")
+    else:
+        when = datetime.datetime.now().replace(second=0, microsecond=0)
+
+    event = {
+        'status': status,
+        'subtext': str(raw.get('subtext') or ''),
+        'description': str(raw.get('description') or ''),
+        'location': str(raw.get('location') or ''),
+        'timestamp': canonical_event_timestamp(when)
+    }
+    return parcel_id, event, when
+
+
+# Validate, group by parcel and commit in one write. The latest event of each
+# parcel sets its status and, when it has one, its current location.
+# Returns one {index, id, ok, error} result per input event.
+def ingest_events(store, raw_events):
+    results = []
+    grouped = {}
+    for index, raw in enumerate(raw_events):
+        parcel_id = raw.get('id') if isinstance(raw, dict) else None
+        try:
+            parcel_id, event, when = validate_event(raw, store)
+        except ValueError as e:
+            results.append({'index': index, 'id': parcel_id, 'ok': False, 'error': str(e)})
+            continue
+        grouped.setdefault(parcel_id, []).append((when, index, event))
+        results.append({'index': index, 'id': parcel_id, 'ok': True})
+
+    with store.batch():
+        for parcel_id, items in grouped.items():
+            items.sort(key=lambda item: (item[0], item[1]))
+            parcel = store.get(parcel_id)
+            # Deleted since it was validated
+            if parcel is None:
+                for _, index, _ in items:
+                    results[index] = {'index': index, 'id': parcel_id, 'ok': False,
+                                      'error': f'Parcel {parcel_id} not found'}
+                continue
+            history = parcel['tracking_history']
+            previous = parse_event_timestamp(history[-1].get('timestamp')) if history else None
+            for _, _, event in items:
+                store.append_event(parcel_id, event)
+            # Late scans are recorded but must not roll the status back
+            if previous is not None and items[-1][0] < previous:
+                continue
+            latest = items[-1][2]
+            fields = {'status': latest['status']}
+            if latest['location']:
+                fields['current_location'] = latest['location']
+            store.update(parcel_id, fields)
+    return results
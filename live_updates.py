@@ -0,0 +1,194 @@
+# Live parcel updates pushed to /track and /view_map over Server-Sent Events.
+#
+# The hub is a store listener, so every committed change to a parcel (the
+# edit form, approvals, change requests, /api/events ingestion) reaches
+# apply(), which queues the new tracking events and status for each
+# subscriber of that parcel. Changes written by other gunicorn workers arrive
+# when this process's store syncs, so while anyone is subscribed a background
+# thread calls sync() every poll_seconds.
+#
+# Each subscriber has a small bounded queue. A client too slow to drain it
+# does not get to hold memory: its backlog is dropped and the next message
+# resends the parcel's whole history instead.
+#
+# A stream keeps one thread busy while it is open, so run gunicorn with
+# threaded (gthread) or async (gevent/eventlet) workers; sync workers would
+# be blocked for a stream's whole lifetime. Streams end after max_seconds and
+# the browser's EventSource reconnects on its own.
+import json, threading, time
+
+HEARTBEAT_SECONDS = 15
+MAX_STREAM_SECONDS = 300
+POLL_SECONDS = 1.0
+MAX_QUEUE = 20
+MAX_SUBSCRIBERS = 200
+
+
+class HubFull(Exception):
+    pass
+
+
+class Subscriber:
+    def __init__(self, parcel_id):
+        self.parcel_id = parcel_id
+        self.messages = []
+        self.wakeup = threading.Event()
+        self.removed = False
+        # What this client has already been sent
+        self.state = None
+        self.history_len = 0
+
+
+# One SSE message
+def sse_message(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+class ParcelEventHub:
+    def __init__(self, sync=None, poll_seconds=POLL_SECONDS, max_queue=MAX_QUEUE, max_subscribers=MAX_SUBSCRIBERS):
+        self.sync = sync
+        self.poll_seconds = poll_seconds
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._count = 0
+        self._poller = None
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+    # Register interest in a parcel before reading it, then pass what was
+    # read to start(), so no change can slip in between
+    def subscribe(self, parcel_id):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise HubFull(f'{self._count} streams open')
+            subscriber = Subscriber(parcel_id)
+            self._subscribers.setdefault(parcel_id, []).append(subscriber)
+            self._count += 1
+            if self.sync is not None and self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='parcel-event-poller', daemon=True)
+                self._poller.start()
+        return subscriber
+
+    # The parcel as read after subscribing. A client that already shows
+    # `known_version` is not sent it again.
+    def start(self, subscriber, parcel, known_version=None):
+        with self._lock:
+            if subscriber.state is not None:
+                return  # A change arrived first and was sent in full
+            if known_version is not None and str(parcel.get('version', 0)) == str(known_version):
+                self._remember(subscriber, parcel)
+            else:
+                self._update(subscriber, parcel)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.parcel_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+                self._count -= 1
+                if not subscribers:
+                    del self._subscribers[subscriber.parcel_id]
+
+    # Keep other workers' changes flowing while anyone is listening
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                if not self._count:
+                    self._poller = None
+                    return
+            try:
+                self.sync()
+            except Exception:
+                pass  # A failed sync is retried on the next tick
+
+    def _state(self, parcel):
+        return (parcel.get('version', 0), parcel.get('updated_at'), parcel.get('status'), parcel.get('current_location'))
+
+    def _remember(self, subscriber, parcel):
+        subscriber.state = self._state(parcel)
+        subscriber.history_len = len(parcel.get('tracking_history') or [])
+
+    # Queue what changed since the subscriber's last message. Called with the lock held.
+    def _update(self, subscriber, parcel):
+        if parcel is None:
+            subscriber.removed = True
+            subscriber.wakeup.set()
+            return
+        state = self._state(parcel)
+        if state == subscriber.state:
+            return
+        history = parcel.get('tracking_history') or []
+        overflow = len(subscriber.messages) >= self.max_queue
+        if overflow:
+            subscriber.messages = []
+        # A first message, a dropped backlog or a rewritten history resend everything
+        reset = subscriber.state is None or overflow or len(history) < subscriber.history_len
+        events = history if reset else history[subscriber.history_len:]
+        if not reset and not events and state[2:] == subscriber.state[2:]:
+            subscriber.state = state
+            return
+        subscriber.messages.append({
+            'version': state[0],
+            'status': parcel.get('status'),
+            'current_location': parcel.get('current_location'),
+            'reset': reset,
+            'events': [dict(e) for e in events]
+        })
+        self._remember(subscriber, parcel)
+        subscriber.wakeup.set()
+
+    # Store listener hooks
+    def reset(self, parcels):
+        with self._lock:
+            if not self._subscribers:
+                return
+            seen = set()
+            for p in parcels:
+                for subscriber in self._subscribers.get(p['id'], ()):
+                    self._update(subscriber, p)
+                    seen.add(p['id'])
+            for parcel_id, subscribers in self._subscribers.items():
+                if parcel_id not in seen:
+                    for subscriber in subscribers:
+                        self._update(subscriber, None)
+
+    def apply(self, parcel_id, parcel):
+        with self._lock:
+            for subscriber in self._subscribers.get(parcel_id, ()):
+                self._update(subscriber, parcel)
+
+    # SSE body for one subscriber: queued updates as they come, a comment
+    # line as heartbeat when idle, until the parcel is removed or time is up
+    def stream(self, subscriber, heartbeat=HEARTBEAT_SECONDS, max_seconds=MAX_STREAM_SECONDS):
+        try:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + max_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                subscriber.wakeup.wait(min(heartbeat, remaining))
+                with self._lock:
+                    subscriber.wakeup.clear()
+                    messages, subscriber.messages = subscriber.messages, []
+                    removed = subscriber.removed
+                for message in messages:
+                    yield sse_message(message, 'update', message['version'])
+                if removed:
+                    yield sse_message({}, 'removed')
+                    return
+                if not messages:
+                    yield ': ping\n\n'
+        finally:
+            self.unsubscribe(subscriber)
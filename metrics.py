@@ -0,0 +1,173 @@
+# In-process counters, gauges and histograms rendered in the Prometheus text
+# format for /metrics.
+#
+# Metrics live in the worker process that records them. With several
+# gunicorn workers each scrape sees one worker, so scrape every worker (or
+# run one) when comparing totals.
+import bisect, threading, time
+from contextlib import contextmanager
+
+# Request latency buckets in seconds, dense around the /track SLO range
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._sample_lines(key, value))
+        return lines
+
+    def _sample_lines(self, key, value):
+        return [f'{self.name}{_label_text(self.labelnames, key)} {_number(value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+# Gauge whose values are read when /metrics is scraped: callback() returns
+# {label value tuple: value}
+class CallbackGauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames, callback):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def render(self):
+        with self._lock:
+            self._values = {tuple(str(v) for v in k): value for k, value in self.callback().items()}
+        return super().render()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _sample_lines(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _label_text(self.labelnames, key, [('le', _number(bound))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _label_text(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_number(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name!r} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback_gauge(self, name, help_text, labelnames, callback):
+        return self.register(CallbackGauge(name, help_text, labelnames, callback))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Storage internals, recorded by the stores themselves
+STORAGE_SECONDS = REGISTRY.histogram(
+    'trackswift_storage_seconds', 'Time spent parsing or serializing stored data', ('store', 'op'))
+STORAGE_BYTES = REGISTRY.counter(
+    'trackswift_storage_bytes_total', 'Bytes read from or written to data files', ('store', 'direction'))
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+# Wraps a store so every public method call is counted and timed.
+# Generators and context managers (iter_all, batch) are timed until they
+# are returned, not until they are exhausted or exited.
+class InstrumentedStore:
+    def __init__(self, store, name, histogram):
+        self._store = store
+        self._name = name
+        self._histogram = histogram
+
+    def __getattr__(self, attr):
+        value = getattr(self._store, attr)
+        if attr.startswith('_') or not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            with timed(self._histogram, store=self._name, call=attr):
+                return value(*args, **kwargs)
+        return call
@@ -0,0 +1,38 @@
+# One-shot copy of the JSON data files into the SQLite backend.
+# Run it once, then start the app with TRACKSWIFT_STORAGE=sqlite.
+import argparse
+import os
+from parcel_store import ParcelStore, ChangeRequestStore, SCHEMA_VERSION
+from sqlite_store import SqliteDatabase, SqliteParcelStore, SqliteChangeRequestStore
+from storage import config_from_env
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Same paths the app uses: TRACKSWIFT_DATA_DIR and TRACKSWIFT_SQLITE_PATH
+CONFIG = config_from_env(os.environ.get('TRACKSWIFT_DATA_DIR', os.path.join(BASE_DIR, 'data')))
+PARCEL_FILE = CONFIG['PARCEL_FILE']
+CHANGE_REQUESTS_FILE = CONFIG['CHANGE_REQUESTS_FILE']
+SQLITE_PATH = CONFIG['SQLITE_PATH']
+
+
+def migrate(parcel_file=PARCEL_FILE, requests_file=CHANGE_REQUESTS_FILE, db_path=SQLITE_PATH):
+    # Reading through ParcelStore replays any pending journal entries
+    parcels = ParcelStore(parcel_file).all()
+    requests = ChangeRequestStore(requests_file).all()
+
+    db = SqliteDatabase(db_path)
+    with db.transaction():
+        SqliteParcelStore(db).save(parcels)
+        SqliteChangeRequestStore(db).save(requests)
+        # The stores hand out records in the current schema
+        db.set_schema_version(SCHEMA_VERSION)
+
+    print(f"Migrated {len(parcels)} parcels and {len(requests)} change requests into {db_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Copy the JSON data files into a SQLite database.')
+    parser.add_argument('--parcels', default=PARCEL_FILE)
+    parser.add_argument('--requests', default=CHANGE_REQUESTS_FILE)
+    parser.add_argument('--db', default=SQLITE_PATH)
+    args = parser.parse_args()
+    migrate(args.parcels, args.requests, args.db)
@@ -0,0 +1,118 @@
+# Schema migrations for the stored parcels and change requests.
+#
+# parcels.json and change_requests.json carry a schema_version (files from
+# before it existed are bare arrays, version 1); the SQLite database keeps it
+# in PRAGMA user_version. Each step below upgrades one record from the
+# previous version. Steps run in order and must be idempotent, since a
+# snapshot and a journal written by newer code can both pass through them.
+#
+# The app runs migrate_data() at startup, so the stores can read records as
+# they are. It can also be run by hand before a deploy:
+#
+#   python migrations.py            # upgrade the configured backend
+#   python migrations.py --check    # print the versions, exit 1 if behind
+import argparse, os, sys
+from parcel_store import (SCHEMA_VERSION, ParcelStore, ChangeRequestStore, normalize_parcel,
+                          stamp_change_request, decode_data_file)
+from timestamps import canonicalize_event_times
+
+
+# (version it upgrades to, what it does, function of one record)
+PARCEL_STEPS = [
+    (2, 'Fill in image, addresses, history, location and names, set name to the receiver', normalize_parcel),
+    (3, 'Store event times as ISO 8601, move unparseable ones to timestamp_text', canonicalize_event_times),
+]
+REQUEST_STEPS = [
+    (2, 'Give change requests a request_id and created_at', stamp_change_request),
+]
+
+# Change requests have not changed since version 2
+assert PARCEL_STEPS[-1][0] == SCHEMA_VERSION and REQUEST_STEPS[-1][0] <= SCHEMA_VERSION
+
+
+def _upgrade(record, from_version, steps):
+    for version, _, step in steps:
+        if version > from_version:
+            record = step(record)
+    return record
+
+
+def upgrade_parcel(parcel, from_version):
+    return _upgrade(parcel, from_version, PARCEL_STEPS)
+
+
+def upgrade_request(request_data, from_version):
+    return _upgrade(request_data, from_version, REQUEST_STEPS)
+
+
+def json_file_version(path, key):
+    if not os.path.exists(path):
+        return SCHEMA_VERSION
+    with open(path, 'rb') as f:
+        return decode_data_file(f.read(), key)[0]
+
+
+# {name: version} of each stored data set for the configured backend
+def data_versions(config):
+    if config.get('STORAGE_BACKEND', 'json') == 'sqlite':
+        from sqlite_store import SqliteDatabase
+        return {'sqlite': SqliteDatabase(config['SQLITE_PATH']).schema_version()}
+    return {'parcels': json_file_version(config['PARCEL_FILE'], 'parcels'),
+            'change_requests': json_file_version(config['CHANGE_REQUESTS_FILE'], 'change_requests')}
+
+
+def _migrate_json(config):
+    path = config['PARCEL_FILE']
+    if json_file_version(path, 'parcels') < SCHEMA_VERSION:
+        # Loading upgrades the snapshot and its journal in memory and compact()
+        # writes them back under the store's lock. A second worker racing here
+        # just loads the upgraded file and rewrites it unchanged.
+        ParcelStore(path, journal=config.get('PARCEL_JOURNAL', True)).compact()
+    # The change request store upgrades its small file on first read
+    ChangeRequestStore(config['CHANGE_REQUESTS_FILE']).count()
+
+
+def _migrate_sqlite(config):
+    from sqlite_store import SqliteDatabase, SqliteParcelStore, SqliteChangeRequestStore
+    db = SqliteDatabase(config['SQLITE_PATH'])
+    with db.transaction():
+        version = db.schema_version()
+        if version >= SCHEMA_VERSION:
+            return
+        parcels, requests = SqliteParcelStore(db), SqliteChangeRequestStore(db)
+        parcels.save([upgrade_parcel(p, version) for p in parcels.all()])
+        requests.save([upgrade_request(r, version) for r in requests.all()])
+        db.set_schema_version(SCHEMA_VERSION)
+
+
+# Bring the configured backend up to SCHEMA_VERSION. Safe to run from several
+# workers at once, SQLite re-checks the version inside its write transaction.
+def migrate_data(config):
+    if config.get('STORAGE_BACKEND', 'json') == 'sqlite':
+        _migrate_sqlite(config)
+    else:
+        _migrate_json(config)
+
+
+if __name__ == "__main__":
+    from storage import config_from_env
+
+    parser = argparse.ArgumentParser(description='Upgrade the stored data to the current schema.')
+    parser.add_argument('--check', action='store_true', help='only report the versions')
+    args = parser.parse_args()
+
+    data_dir = os.environ.get('TRACKSWIFT_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+    config = config_from_env(data_dir)
+    before = data_versions(config)
+    for name, version in before.items():
+        print(f'{name}: schema version {version} (current {SCHEMA_VERSION})')
+    if args.check:
+        sys.exit(1 if any(v < SCHEMA_VERSION for v in before.values()) else 0)
+    if all(v >= SCHEMA_VERSION for v in before.values()):
+        print('Nothing to do')
+    else:
+        for version, summary, _ in PARCEL_STEPS:
+            if version > min(before.values()):
+                print(f'  step {version}: {summary}')
+        migrate_data(config)
+        print('Migrated:', ', '.join(f'{n} -> {v}' for n, v in data_versions(config).items()))
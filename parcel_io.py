@@ -0,0 +1,181 @@
+# Streaming bulk export and import of parcels as NDJSON or CSV.
+#
+# Exports are generators over the store, so a response or output file is
+# written row by row. Imports read their input line by line, validate each
+# record, apply the same field defaults as the loader and commit every
+# `chunk_size` records in one store batch.
+#
+#   python parcel_io.py export --format csv --history -o parcels.csv
+#   python parcel_io.py import partner_feed.ndjson --on-conflict skip
+import argparse, csv, io, json, os, sys
+from parcel_store import normalize_parcel
+from timestamps import canonicalize_event_times
+
+FORMATS = ('ndjson', 'csv')
+CSV_COLUMNS = [
+    'id', 'sender_name', 'receiver_name', 'status', 'address', 'start_address',
+    'end_address', 'current_location', 'price', 'phone', 'email', 'payment_type',
+    'region', 'image'
+]
+MAX_REPORTED_ERRORS = 100
+
+
+def _export_record(parcel, history):
+    record = {k: v for k, v in parcel.items() if k != 'tracking_history'}
+    if history:
+        record['tracking_history'] = parcel.get('tracking_history', [])
+    return record
+
+
+def export_ndjson(parcels, history=True):
+    for parcel in parcels:
+        yield json.dumps(_export_record(parcel, history), ensure_ascii=False) + '\n'
+
+
+# History, when included, is one JSON-encoded column
+def export_csv(parcels, history=False):
+    columns = CSV_COLUMNS + (['tracking_history'] if history else [])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(columns)
+    yield flush()
+    for parcel in parcels:
+        row = [parcel.get(c, '') for c in CSV_COLUMNS]
+        if history:
+            row.append(json.dumps(parcel.get('tracking_history', []), ensure_ascii=False))
+        writer.writerow(row)
+        yield flush()
+
+
+def export_parcels(parcels, fmt='ndjson', history=True):
+    if fmt == 'ndjson':
+        return export_ndjson(parcels, history)
+    if fmt == 'csv':
+        return export_csv(parcels, history)
+    raise ValueError(f"Unknown format {fmt!r}, expected one of {FORMATS}")
+
+
+# (line_number, record or ValueError) for every non-empty input line
+def read_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, ValueError('Not valid JSON')
+
+
+def read_csv(lines):
+    text_lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    reader = csv.DictReader(text_lines)
+    for record in reader:
+        if record.get('tracking_history'):
+            try:
+                record['tracking_history'] = json.loads(record['tracking_history'])
+            except ValueError:
+                yield reader.line_num, ValueError('tracking_history is not valid JSON')
+                continue
+        elif 'tracking_history' in record:
+            del record['tracking_history']
+        yield reader.line_num, {k: v for k, v in record.items() if k is not None}
+
+
+# Check one imported record and fill in defaults, raises ValueError
+def validate_record(record):
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+    parcel_id = str(record.get('id') or '').strip()
+    if not parcel_id:
+        raise ValueError("Missing 'id'")
+    history = record.get('tracking_history', [])
+    if not isinstance(history, list) or not all(isinstance(e, dict) for e in history):
+        raise ValueError('tracking_history must be a list of objects')
+    parcel = {k: ('' if v is None else str(v)) for k, v in record.items() if k != 'tracking_history'}
+    parcel['id'] = parcel_id
+    parcel['tracking_history'] = history
+    parcel.setdefault('status', 'Pending Pickup')
+    return canonicalize_event_times(normalize_parcel(parcel))
+
+
+# Import records, committing every chunk_size parcels in one batch.
+# on_conflict: 'replace' overwrites existing IDs, 'skip' leaves them alone.
+def import_parcels(store, lines, fmt='ndjson', chunk_size=1000, on_conflict='replace'):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {FORMATS}")
+    reader = read_ndjson(lines) if fmt == 'ndjson' else read_csv(lines)
+    stats = {'imported': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+    chunk = []
+
+    def commit():
+        with store.batch():
+            for parcel in chunk:
+                if on_conflict == 'skip' and store.get(parcel['id']) is not None:
+                    stats['skipped'] += 1
+                else:
+                    store.add(parcel)
+                    stats['imported'] += 1
+        chunk.clear()
+
+    for line_number, record in reader:
+        try:
+            if isinstance(record, Exception):
+                raise record
+            chunk.append(validate_record(record))
+        except ValueError as e:
+            stats['failed'] += 1
+            if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                stats['errors'].append({'line': line_number, 'error': str(e)})
+            continue
+        if len(chunk) >= chunk_size:
+            commit()
+    if chunk:
+        commit()
+    return stats
+
+
+if __name__ == "__main__":
+    from storage import open_stores, config_from_env
+
+    parser = argparse.ArgumentParser(description='Bulk export or import parcels.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_cmd = commands.add_parser('export')
+    export_cmd.add_argument('--format', choices=FORMATS, default='ndjson')
+    export_cmd.add_argument('--history', action='store_true', help='include tracking history')
+    export_cmd.add_argument('-o', '--output', help='output file (default: stdout)')
+    import_cmd = commands.add_parser('import')
+    import_cmd.add_argument('input', help="input file, or '-' for stdin")
+    import_cmd.add_argument('--format', choices=FORMATS, default=None, help='default: from the file extension')
+    import_cmd.add_argument('--chunk-size', type=int, default=1000)
+    import_cmd.add_argument('--on-conflict', choices=('replace', 'skip'), default='replace')
+    args = parser.parse_args()
+
+    data_dir = os.environ.get('TRACKSWIFT_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+    parcel_store, _ = open_stores(config_from_env(data_dir))
+
+    if args.command == 'export':
+        out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            for chunk in export_parcels(parcel_store.iter_all(), args.format, args.history):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+    else:
+        fmt = args.format or ('csv' if args.input.endswith('.csv') else 'ndjson')
+        source = sys.stdin if args.input == '-' else open(args.input, 'r', encoding='utf-8', newline='')
+        try:
+            stats = import_parcels(parcel_store, source, fmt, args.chunk_size, args.on_conflict)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(json.dumps(stats, indent=2))
@@ -0,0 +1,535 @@
+# Process level parcel store, keeps parsed parcels in memory between requests.
+#
+# In journal mode every create, update, tracking event or delete is appended as
+# one JSON line to a log next to the snapshot file. Loading replays the log on
+# top of the snapshot, and once the log passes `compact_bytes` it is folded back
+# into the snapshot and truncated.
+#
+# Listeners (search index, aggregates, ...) get reset(parcels) after a full
+# load and apply(parcel_id, parcel_or_None) after every entry, including
+# entries written by other processes and picked up from the journal tail.
+#
+# Several processes can share the files: writes happen under an exclusive
+# file lock after catching up with the journal, and every write bumps the
+# parcel's `version` and `updated_at` so callers can detect stale reads.
+#
+# Both data files are {"schema_version": N, "<records>": [...]}, written
+# compactly. Records are trusted to match the current schema on read; files
+# from older versions are brought up to date once by migrations.py.
+import datetime, gc, json, logging, os, threading, uuid
+from contextlib import contextmanager
+from file_lock import FileLock
+from metrics import STORAGE_SECONDS, STORAGE_BYTES, timed
+
+log = logging.getLogger(__name__)
+
+
+class VersionConflict(Exception):
+    def __init__(self, parcel_id, expected, actual):
+        super().__init__(f'Parcel {parcel_id} is at version {actual}, expected {expected}')
+        self.parcel_id = parcel_id
+        self.expected = expected
+        self.actual = actual
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+# Current layout of the records, see migrations.py for the steps to it
+SCHEMA_VERSION = 3
+
+
+# (schema version, records) from a data file's bytes. Files written before
+# the schema was versioned are a bare JSON array, version 1.
+def decode_data_file(raw, key):
+    # The parse creates millions of objects and nothing to collect, so the
+    # cyclic GC is paused for it (about a third of the parse time otherwise)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        data = json.loads(raw)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    if isinstance(data, list):
+        return 1, data
+    version = data.get('schema_version', 1)
+    if version > SCHEMA_VERSION:
+        raise ValueError(f'Data file has schema version {version}, this code only knows up to {SCHEMA_VERSION}')
+    return version, data[key]
+
+
+def encode_data_file(key, records):
+    data = {'schema_version': SCHEMA_VERSION, key: records}
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# Fill in fields that new or imported records may be missing. Applied on
+# write; stored records already have them.
+def normalize_parcel(p):
+    if 'image' not in p: p['image'] = ''
+    if 'start_address' not in p: p['start_address'] = ''
+    if 'end_address' not in p: p['end_address'] = p.get('address', '')
+    if 'tracking_history' not in p: p['tracking_history'] = []
+    if 'current_location' not in p: p['current_location'] = p.get('address', '')
+    # Migration for names
+    if 'sender_name' not in p: p['sender_name'] = 'Unknown Sender'
+    if 'receiver_name' not in p: p['receiver_name'] = p.get('name', 'Unknown Receiver')
+    # Ensure name is receiver_name for backward compatibility
+    p['name'] = p['receiver_name']
+    return p
+
+
+class ParcelStore:
+    def __init__(self, path, journal=True, compact_bytes=4 * 1024 * 1024):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + '.journal' if journal else None
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + '.lock')
+        self._stamp = None
+        self._offset = 0
+        self._pending = None
+        self._by_id = {}
+        self._by_lower_id = {}
+        self._listeners = []
+
+    # Create an empty data file on first run
+    def _ensure_file(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        if not os.path.exists(self.path):
+            with open(self.path, 'wb') as f:
+                f.write(encode_data_file('parcels', []))
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _journal_size(self):
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return 0
+        return os.path.getsize(self.journal_path)
+
+    # Re-read the snapshot only when its mtime or size changed, then replay
+    # whatever part of the journal has not been applied yet
+    def _refresh(self):
+        if self._pending is not None:
+            return
+        self._ensure_file()
+        if self._file_stamp() == self._stamp and self._journal_size() == self._offset:
+            return
+        with self._file_lock.shared():
+            self._reload()
+
+    def _reload(self):
+        stamp = self._file_stamp()
+        journal_size = self._journal_size()
+        if stamp != self._stamp or journal_size < self._offset:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            STORAGE_BYTES.inc(len(raw), store='parcels', direction='read')
+            with timed(STORAGE_SECONDS, store='parcels', op='parse'):
+                version, data = decode_data_file(raw, 'parcels')
+            self._by_id = {}
+            self._by_lower_id = {}
+            for p in data:
+                self._put(p)
+            self._stamp = stamp
+            self._offset = 0
+            if version < SCHEMA_VERSION:
+                self._upgrade(version)
+            for listener in self._listeners:
+                listener.reset(list(self._by_id.values()))
+        if journal_size > self._offset:
+            self._replay()
+
+    # A snapshot that has not been migrated yet: replay the journal written
+    # against it, then upgrade everything in memory. Steps are idempotent, so
+    # entries already written in the current schema are safe. migrations.py
+    # rewrites the file, so this only happens until it has run.
+    def _upgrade(self, version):
+        from migrations import upgrade_parcel
+        listeners, self._listeners = self._listeners, []
+        try:
+            if self._journal_size() > self._offset:
+                self._replay()
+        finally:
+            self._listeners = listeners
+        for p in self._by_id.values():
+            upgrade_parcel(p, version)
+
+    def _replay(self):
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # A trailing line without a newline is a write still in progress
+        end = chunk.rfind(b'\n') + 1
+        STORAGE_BYTES.inc(end, store='journal', direction='read')
+        with timed(STORAGE_SECONDS, store='journal', op='replay'):
+            for line in chunk[:end].splitlines():
+                if not line.strip():
+                    continue
+                # Left by a writer that crashed mid-line before appends truncated it
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    log.warning('Skipping undecodable journal line in %s: %.80r', self.journal_path, line)
+                    continue
+                self._apply(entry)
+        self._offset += end
+
+    def _put(self, parcel):
+        self._by_id[parcel['id']] = parcel
+        self._by_lower_id[parcel['id'].lower()] = parcel
+
+    # Apply one journal entry to the in-memory state
+    def _apply(self, entry):
+        op = entry['op']
+        if op == 'put':
+            parcel = entry['parcel']
+            self._put(parcel)
+        else:
+            parcel = self._by_id.get(entry['id'])
+            if parcel is None:
+                return
+            self._apply_to(parcel, entry)
+        for listener in self._listeners:
+            listener.apply(parcel['id'], self._by_id.get(parcel['id']))
+
+    def _apply_to(self, parcel, entry):
+        op = entry['op']
+        if op == 'update':
+            parcel.update(entry['fields'])
+            parcel['name'] = parcel['receiver_name']
+        elif op == 'event':
+            # Events carry their position so replaying twice is harmless
+            history = parcel['tracking_history']
+            del history[entry['index']:]
+            history.append(entry['event'])
+            if 'version' in entry:
+                parcel['version'] = entry['version']
+                parcel['updated_at'] = entry['updated_at']
+        elif op == 'delete':
+            del self._by_id[parcel['id']]
+            del self._by_lower_id[parcel['id'].lower()]
+
+    # Give a put/update/event entry the parcel's next version
+    def _stamp_entry(self, entry):
+        parcel_id = entry['parcel']['id'] if entry['op'] == 'put' else entry['id']
+        current = self._by_id.get(parcel_id)
+        stamp = {'version': (current.get('version', 0) if current else 0) + 1, 'updated_at': utc_now()}
+        if entry['op'] == 'put':
+            entry['parcel'] = dict(entry['parcel'], **stamp)
+        elif entry['op'] == 'update':
+            entry['fields'] = dict(entry['fields'], **stamp)
+        elif entry['op'] == 'event':
+            entry.update(stamp)
+
+    # Apply one entry in memory and persist it, or queue it inside a batch.
+    # It is serialized first so memory always matches what was written.
+    def _commit(self, entry):
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            self._stamp_entry(entry)
+            with timed(STORAGE_SECONDS, store='journal', op='serialize'):
+                line = json.dumps(entry) + '\n'
+            self._apply(json.loads(line))
+            if self._pending is not None:
+                self._pending.append(line)
+            else:
+                self._write([line])
+
+    def _write(self, lines):
+        if not lines:
+            return
+        if not self.journal_path:
+            self._write_snapshot()
+            return
+        data = ''.join(lines).encode('utf-8')
+        with open(self.journal_path, 'ab') as f:
+            # Bytes past the last complete line are what a crashed writer
+            # left; nobody else writes while we hold the lock, so drop them
+            # rather than append onto the fragment
+            if f.seek(0, os.SEEK_END) > self._offset:
+                log.warning('Dropping %d bytes of a partial journal line in %s',
+                            f.tell() - self._offset, self.journal_path)
+                f.truncate(self._offset)
+            f.write(data)
+        STORAGE_BYTES.inc(len(data), store='journal', direction='written')
+        self._offset += len(data)
+        if self._offset > self.compact_bytes:
+            self.compact()
+
+    # Write to a temporary file and rename it over the snapshot, so readers
+    # see either the old file or the complete new one
+    def _write_snapshot(self):
+        self._ensure_file()
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with timed(STORAGE_SECONDS, store='parcels', op='serialize'):
+            data = encode_data_file('parcels', list(self._by_id.values()))
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        STORAGE_BYTES.inc(len(data), store='parcels', direction='written')
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    # Group several mutations into a single write. Other processes wait for
+    # the batch, so reads inside it see the latest state.
+    @contextmanager
+    def batch(self):
+        with self._lock, self._file_lock.exclusive():
+            if self._pending is not None:
+                yield self
+                return
+            self._refresh()
+            self._pending = []
+            try:
+                yield self
+            except BaseException:
+                # Drop the half-applied batch and re-read from disk
+                self._pending = None
+                self._stamp = None
+                raise
+            lines, self._pending = self._pending, None
+            self._write(lines)
+
+    # Fold the journal into the snapshot and start a new one
+    def compact(self):
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            self._write_snapshot()
+            if self.journal_path and os.path.exists(self.journal_path):
+                open(self.journal_path, 'w').close()
+            self._offset = 0
+
+    # Register an index that follows every change to the parcels
+    def add_listener(self, listener):
+        self.add_listeners(listener)
+
+    # Register several indexes at once, same as adding them one by one
+    def add_listeners(self, *listeners):
+        with self._lock:
+            self._refresh()
+            self._listeners.extend(listeners)
+            parcels = list(self._by_id.values())
+            for listener in listeners:
+                listener.reset(parcels)
+
+    # Pick up changes made by other processes
+    def sync(self):
+        with self._lock:
+            self._refresh()
+
+    # All parcels, the list is a copy but the parcel dicts are shared
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self._by_id.values())
+
+    # Iterate over parcels, for streaming exports
+    def iter_all(self):
+        yield from self.all()
+
+    # Exact ID lookup
+    def get(self, parcel_id):
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(parcel_id)
+
+    # Parcels for a list of IDs in that order, skipping unknown ones
+    def get_many(self, parcel_ids):
+        with self._lock:
+            self._refresh()
+            return [self._by_id[i] for i in parcel_ids if i in self._by_id]
+
+    # Case-insensitive ID lookup
+    def find(self, query):
+        with self._lock:
+            self._refresh()
+            return self._by_lower_id.get(query.strip().lower())
+
+    # Create a parcel, or replace it if the ID already exists
+    def add(self, parcel):
+        self._commit({'op': 'put', 'parcel': normalize_parcel(parcel)})
+
+    # Change top level fields of an existing parcel. With expected_version the
+    # write only happens if nobody changed the parcel since it was read.
+    def update(self, parcel_id, fields, expected_version=None):
+        with self._lock, self._file_lock.exclusive():
+            parcel = self.get(parcel_id)
+            if parcel is None:
+                raise KeyError(parcel_id)
+            if expected_version is not None and parcel.get('version', 0) != expected_version:
+                raise VersionConflict(parcel_id, expected_version, parcel.get('version', 0))
+            self._commit({'op': 'update', 'id': parcel_id, 'fields': fields})
+
+    # Read-compute-write with optimistic retries: change(parcel_copy) returns
+    # the fields to set (or None for no change) and is re-run on conflict
+    def modify(self, parcel_id, change, retries=5):
+        return modify_parcel(self, parcel_id, change, retries)
+
+    # Append one entry to a parcel's tracking history
+    def append_event(self, parcel_id, event):
+        with self._lock, self._file_lock.exclusive():
+            parcel = self.get(parcel_id)
+            if parcel is None:
+                raise KeyError(parcel_id)
+            index = len(parcel['tracking_history'])
+            self._commit({'op': 'event', 'id': parcel_id, 'index': index, 'event': event})
+
+    def delete(self, parcel_id):
+        with self._lock, self._file_lock.exclusive():
+            if self.get(parcel_id) is None:
+                return False
+            self._commit({'op': 'delete', 'id': parcel_id})
+            return True
+
+    # Replace every parcel with a full snapshot rewrite
+    def save(self, parcels):
+        with self._lock, self._file_lock.exclusive():
+            self._by_id = {}
+            self._by_lower_id = {}
+            for p in parcels:
+                self._put(normalize_parcel(p))
+            self._write_snapshot()
+            if self.journal_path and os.path.exists(self.journal_path):
+                open(self.journal_path, 'w').close()
+            self._offset = 0
+            for listener in self._listeners:
+                listener.reset(list(self._by_id.values()))
+
+
+# Shared retry loop behind ParcelStore.modify and SqliteParcelStore.modify.
+# Returns the updated parcel, or None if change() asked for no write.
+def modify_parcel(store, parcel_id, change, retries=5):
+    for _ in range(retries + 1):
+        parcel = store.get(parcel_id)
+        if parcel is None:
+            raise KeyError(parcel_id)
+        parcel = json.loads(json.dumps(parcel))
+        fields = change(parcel)
+        if not fields:
+            return None
+        try:
+            store.update(parcel_id, fields, expected_version=parcel.get('version', 0))
+        except VersionConflict:
+            continue
+        return store.get(parcel_id)
+    raise VersionConflict(parcel_id, parcel.get('version', 0), store.get(parcel_id).get('version', 0))
+
+
+# Give a change request its key and timestamp if it does not have them yet
+def stamp_change_request(request_data):
+    if not request_data.get('request_id'):
+        request_data['request_id'] = uuid.uuid4().hex[:12]
+    if not request_data.get('created_at'):
+        # Microseconds keep requests from the same second in submission order
+        request_data['created_at'] = datetime.datetime.now().isoformat(sep=' ', timespec='microseconds')
+    return request_data
+
+
+# Change requests kept in their own JSON file, cached like the parcels and
+# indexed by request_id and by parcel ID
+class ChangeRequestStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + '.lock')
+        self._stamp = None
+        self._requests = []
+        self._by_id = {}
+        self._by_parcel = {}
+
+    def _refresh(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        if not os.path.exists(self.path):
+            with open(self.path, 'wb') as f:
+                f.write(encode_data_file('change_requests', []))
+        st = os.stat(self.path)
+        if (st.st_mtime_ns, st.st_size) == self._stamp:
+            return
+        with self._file_lock.shared():
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+        STORAGE_BYTES.inc(len(raw), store='change_requests', direction='read')
+        with timed(STORAGE_SECONDS, store='change_requests', op='parse'):
+            version, requests = decode_data_file(raw, 'change_requests')
+        # The file is small, so an older one is upgraded and written back here
+        if version < SCHEMA_VERSION:
+            from migrations import upgrade_request
+            with self._file_lock.exclusive():
+                self.save([upgrade_request(r, version) for r in requests])
+        else:
+            self._set(requests)
+            self._stamp = stamp
+
+    def _set(self, requests):
+        self._requests = list(requests)
+        self._by_id = {r['request_id']: r for r in self._requests}
+        self._by_parcel = {}
+        for r in self._requests:
+            self._by_parcel.setdefault(r['id'], []).append(r)
+
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return list(self._requests)
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return len(self._requests)
+
+    # Oldest first
+    def page(self, offset=0, limit=50):
+        with self._lock:
+            self._refresh()
+            return self._requests[offset:offset + limit]
+
+    def get(self, request_id):
+        with self._lock:
+            self._refresh()
+            return self._by_id.get(request_id)
+
+    def for_parcel(self, parcel_id):
+        with self._lock:
+            self._refresh()
+            return list(self._by_parcel.get(parcel_id, []))
+
+    def add(self, request_data):
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            self.save(self._requests + [stamp_change_request(request_data)])
+            return request_data
+
+    # Drop many requests with one write, returns the IDs that existed
+    def remove(self, request_ids):
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            removed = {i for i in request_ids if i in self._by_id}
+            if removed:
+                self.save([r for r in self._requests if r['request_id'] not in removed])
+            return removed
+
+    def save(self, requests):
+        with self._lock, self._file_lock.exclusive():
+            requests = [stamp_change_request(r) for r in requests]
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with timed(STORAGE_SECONDS, store='change_requests', op='serialize'):
+                data = encode_data_file('change_requests', requests)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            STORAGE_BYTES.inc(len(data), store='change_requests', direction='written')
+            os.replace(tmp_path, self.path)
+            self._set(requests)
+            st = os.stat(self.path)
+            self._stamp = (st.st_mtime_ns, st.st_size)
@@ -0,0 +1,59 @@
+# Sampling profiler for a single request.
+#
+# A background thread looks at the request thread's stack every `interval`
+# seconds and counts each distinct stack. The result is in the collapsed
+# format ("outer;inner;leaf count" per line) read by flamegraph.pl and
+# speedscope. Sampling costs a little per tick and nothing per call, so it is
+# safe to switch on for one slow request in production.
+import os, sys, threading, time
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id=None, interval=0.002, max_depth=64):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self.elapsed = 0.0
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+        return self
+
+    # Collapsed stacks, most sampled first
+    def collapsed(self):
+        items = sorted(self.counts.items(), key=lambda item: -item[1])
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
@@ -1,106 +1,111 @@
 
-import json
 import os
 import random
+import shutil
+from parcel_store import ParcelStore, ChangeRequestStore
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
+DATA_DIR = os.environ.get('TRACKSWIFT_DATA_DIR', os.path.join(BASE_DIR, 'data'))
 PARCEL_FILE = os.path.join(DATA_DIR, 'parcels.json')
 CHANGE_REQUESTS_FILE = os.path.join(DATA_DIR, 'change_requests.json')
 
+# Diverse Indian Names (North, South, East, West)
+FIRST_NAMES = [
+    "Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", "Ayaan", "Krishna", "Ishaan",
+    "Diya", "Saanvi", "Ananya", "Aadhya", "Pari", "Anika", "Navya", "Angel", "Myra", "Riya",
+    "Rohan", "Vikram", "Neha", "Pooja", "Suresh", "Ramesh", "Geeta", "Sita", "Mohan", "Sohan"
+]
+LAST_NAMES = [
+    "Sharma", "Gupta", "Patel", "Kumar", "Singh", "Reddy", "Joshi", "Malhotra", "Choudhury", "Iyer",
+    "Verma", "Mehta", "Nair", "Das", "Chatterjee", "Banerjee", "Fernandes", "Khan", "Ali", "Mishra",
+    "Yadav", "Gowda", "Rao", "Shetty", "Deshmukh", "Pawar", "Bhat", "Kulkarni", "Jain", "Agarwal"
+]
+
+# Diverse Locations and Hubs
+LOCATIONS = [
+    {"city": "Mumbai", "state": "Maharashtra", "hubs": ["Bhiwandi Hub", "Lower Parel Hub", "Andheri East Hub"]},
+    {"city": "Delhi", "state": "Delhi", "hubs": ["Okhla Phase III", "Dwarka Sector 9", "Connaught Place"]},
+    {"city": "Bangalore", "state": "Karnataka", "hubs": ["Electronic City", "Whitefield", "Koramangala"]},
+    {"city": "Hyderabad", "state": "Telangana", "hubs": ["Madhapur", "Banjara Hills", "Secunderabad"]},
+    {"city": "Chennai", "state": "Tamil Nadu", "hubs": ["Guindy", "T Nagar", "Anna Nagar"]},
+    {"city": "Kolkata", "state": "West Bengal", "hubs": ["Salt Lake", "Park Street", "Howrah"]},
+    {"city": "Pune", "state": "Maharashtra", "hubs": ["Hinjewadi", "Viman Nagar", "Kothrud"]},
+    {"city": "Ahmedabad", "state": "Gujarat", "hubs": ["SG Highway", "Maninagar", "Satellite"]},
+    {"city": "Jaipur", "state": "Rajasthan", "hubs": ["Malviya Nagar", "Vaishali Nagar", "C Scheme"]},
+    {"city": "Lucknow", "state": "Uttar Pradesh", "hubs": ["Gomti Nagar", "Hazratganj", "Alambagh"]}
+]
+
+LOGISTICS_PARTNERS = ["Ekart Logistics", "BlueDart Express", "Delhivery", "Ecom Express", "Xpressbees", "Shadowfax", "Gati"]
+
 def seed_data():
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
-    # Clear existing data
-    with open(CHANGE_REQUESTS_FILE, 'w') as f:
-        json.dump([], f)
+    # Clear existing data. The stores write under their file locks, and the
+    # parcel store empties its journal so old entries are not replayed onto
+    # the new seed; archived parcels and the ID sequence go with them.
+    ChangeRequestStore(CHANGE_REQUESTS_FILE).save([])
+    shutil.rmtree(os.path.join(DATA_DIR, 'archive'), ignore_errors=True)
+    if os.path.exists(os.path.join(DATA_DIR, 'id_sequence')):
+        os.remove(os.path.join(DATA_DIR, 'id_sequence'))
 
     parcels = []
     
-    # Diverse Indian Names (North, South, East, West)
-    first_names = [
-        "Aarav", "Vivaan", "Aditya", "Vihaan", "Arjun", "Sai", "Reyansh", "Ayaan", "Krishna", "Ishaan",
-        "Diya", "Saanvi", "Ananya", "Aadhya", "Pari", "Anika", "Navya", "Angel", "Myra", "Riya",
-        "Rohan", "Vikram", "Neha", "Pooja", "Suresh", "Ramesh", "Geeta", "Sita", "Mohan", "Sohan"
-    ]
-    last_names = [
-        "Sharma", "Gupta", "Patel", "Kumar", "Singh", "Reddy", "Joshi", "Malhotra", "Choudhury", "Iyer",
-        "Verma", "Mehta", "Nair", "Das", "Chatterjee", "Banerjee", "Fernandes", "Khan", "Ali", "Mishra",
-        "Yadav", "Gowda", "Rao", "Shetty", "Deshmukh", "Pawar", "Bhat", "Kulkarni", "Jain", "Agarwal"
-    ]
-    
-    # Diverse Locations and Hubs
-    locations = [
-        {"city": "Mumbai", "state": "Maharashtra", "hubs": ["Bhiwandi Hub", "Lower Parel Hub", "Andheri East Hub"]},
-        {"city": "Delhi", "state": "Delhi", "hubs": ["Okhla Phase III", "Dwarka Sector 9", "Connaught Place"]},
-        {"city": "Bangalore", "state": "Karnataka", "hubs": ["Electronic City", "Whitefield", "Koramangala"]},
-        {"city": "Hyderabad", "state": "Telangana", "hubs": ["Madhapur", "Banjara Hills", "Secunderabad"]},
-        {"city": "Chennai", "state": "Tamil Nadu", "hubs": ["Guindy", "T Nagar", "Anna Nagar"]},
-        {"city": "Kolkata", "state": "West Bengal", "hubs": ["Salt Lake", "Park Street", "Howrah"]},
-        {"city": "Pune", "state": "Maharashtra", "hubs": ["Hinjewadi", "Viman Nagar", "Kothrud"]},
-        {"city": "Ahmedabad", "state": "Gujarat", "hubs": ["SG Highway", "Maninagar", "Satellite"]},
-        {"city": "Jaipur", "state": "Rajasthan", "hubs": ["Malviya Nagar", "Vaishali Nagar", "C Scheme"]},
-        {"city": "Lucknow", "state": "Uttar Pradesh", "hubs": ["Gomti Nagar", "Hazratganj", "Alambagh"]}
-    ]
-
-    logistics_partners = ["Ekart Logistics", "BlueDart Express", "Delhivery", "Ecom Express", "Xpressbees", "Shadowfax", "Gati"]
-
     for i in range(25): # Generate 25 parcels
         pid = f"TRK2026{random.randint(10000, 99999)}"
-        name = f"{random.choice(first_names)} {random.choice(last_names)}"
+        name = f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}"
         
-        dest = random.choice(locations)
-        origin = random.choice(locations)
+        dest = random.choice(LOCATIONS)
+        origin = random.choice(LOCATIONS)
         while origin == dest: # Ensure different origin/dest
-            origin = random.choice(locations)
+            origin = random.choice(LOCATIONS)
             
         addr = f"Flat {random.randint(1, 900)}, {random.choice(['Green Apts', 'Sunshine Tower', 'Galaxy Heights', 'Palm Grove', 'Royal Enclave'])}, {dest['city']}, {dest['state']}"
         start_addr = f"Main Warehouse, {origin['hubs'][0]}, {origin['city']}, {origin['state']}"
         
-        courier = random.choice(logistics_partners)
-        agent = f"{random.choice(first_names)} ({random.randint(7000000000, 9999999999)})"
+        courier = random.choice(LOGISTICS_PARTNERS)
+        agent = f"{random.choice(FIRST_NAMES)} ({random.randint(7000000000, 9999999999)})"
 
         # Construct History
         history = [
             {
                 "status": "Order Confirmed",
-                "timestamp": "Mon, 26th Jan '26 - 09:30am",
+                "timestamp": "2026-01-26T09:30:00",
                 "location": "Online",
                 "description": "Your Order has been placed.",
                 "subtext": f"Order ID #OD{random.randint(1000000, 9999999)}"
             },
             {
                 "status": "Picked Up",
-                "timestamp": "Tue, 27th Jan '26 - 02:15pm",
+                "timestamp": "2026-01-27T14:15:00",
                 "location": start_addr,
                 "description": "Seller has handed over the package.",
                 "subtext": f"{courier}"
             },
             {
                 "status": "In Transit",
-                "timestamp": "Wed, 28th Jan '26 - 11:00am",
+                "timestamp": "2026-01-28T11:00:00",
                 "location": f"{random.choice(origin['hubs'])}, {origin['city']}",
                 "description": "Arrived at Origin Facility",
                 "subtext": "Processing"
             },
             {
                 "status": "Shipped",
-                "timestamp": "Thu, 29th Jan '26 - 05:45pm",
+                "timestamp": "2026-01-29T17:45:00",
                 "location": f"{random.choice(dest['hubs'])}, {dest['city']}",
                 "description": "Arrived at Destination Hub",
                 "subtext": f"{courier} Facility"
             },
             {
                 "status": "Out For Delivery",
-                "timestamp": "Fri, 30th Jan '26 - 08:30am",
+                "timestamp": "2026-01-30T08:30:00",
                 "location": f"{dest['city']} Delivery Center",
                 "description": "Your item is out for delivery",
                 "subtext": f"Agent: {agent}"
             },
             {
                 "status": "Delivered",
-                "timestamp": "Fri, 30th Jan '26 - 06:20pm",
+                "timestamp": "2026-01-30T18:20:00",
                 "location": addr,
                 "description": "Your item has been delivered",
                 "subtext": "Signed by: Receiver"
@@ -125,8 +130,7 @@ def seed_data():
         }
         parcels.append(parcel)
 
-    with open(PARCEL_FILE, 'w') as f:
-        json.dump(parcels, f, indent=4)
+    ParcelStore(PARCEL_FILE).save(parcels)
     
     print(f"Successfully seeded {len(parcels)} diverse parcels into {PARCEL_FILE}")
 
@@ -0,0 +1,143 @@
+# Trigram index over parcel contact fields for the /track name search.
+#
+# Every field value is lowercased and broken into trigrams, padded with two
+# leading spaces per word so short queries can still match word prefixes.
+# Queries of three or more characters match anywhere in a field; shorter ones
+# match the start of a word. The index is a store listener, so it is updated
+# incrementally on every create, edit and delete.
+import threading
+
+SEARCH_FIELDS = ('receiver_name', 'sender_name', 'email', 'phone')
+
+# Ranking weights: where the query matched, and in which field
+MATCH_SCORES = {'exact': 100, 'prefix': 60, 'word_prefix': 40, 'substring': 10}
+FIELD_SCORES = {'receiver_name': 4, 'sender_name': 3, 'email': 2, 'phone': 1}
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Trigrams stored for one field value
+def field_grams(value):
+    grams = _trigrams('  ' + value + ' ')
+    for word in value.split()[1:]:
+        grams |= _trigrams('  ' + word[:2])
+    return grams
+
+
+# Trigrams every matching field must contain
+def query_grams(query):
+    if len(query) >= 3:
+        return _trigrams(query)
+    return _trigrams('  ' + query)
+
+
+def _match(query, value):
+    pos = value.find(query)
+    if pos < 0:
+        return None
+    if pos == 0:
+        return 'exact' if len(value) == len(query) else 'prefix'
+    if ' ' + query in value:
+        return 'word_prefix'
+    return 'substring' if len(query) >= 3 else None
+
+
+class TrigramIndex:
+    def __init__(self, fields=SEARCH_FIELDS):
+        self.fields = fields
+        self._lock = threading.Lock()
+        self._docs = {}
+        self._postings = {}
+
+    def _add(self, parcel_id, parcel):
+        values = {f: str(parcel.get(f) or '').lower() for f in self.fields}
+        # All fields in one string for a quick C-level substring pre-check
+        haystack = ' ' + ' | '.join(values.values())
+        self._docs[parcel_id] = (values, haystack)
+        for value in values.values():
+            for gram in field_grams(value):
+                self._postings.setdefault(gram, set()).add(parcel_id)
+
+    def _remove(self, parcel_id):
+        doc = self._docs.pop(parcel_id, None)
+        if not doc:
+            return
+        for value in doc[0].values():
+            for gram in field_grams(value):
+                ids = self._postings.get(gram)
+                if ids is not None:
+                    ids.discard(parcel_id)
+                    if not ids:
+                        del self._postings[gram]
+
+    # Store listener hooks
+    def reset(self, parcels):
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            for p in parcels:
+                self._add(p['id'], p)
+
+    def apply(self, parcel_id, parcel):
+        with self._lock:
+            self._remove(parcel_id)
+            if parcel is not None:
+                self._add(parcel_id, parcel)
+
+    # (parcel_id, field values) for every parcel whose fields contain the query
+    def _verified(self, query):
+        if not query:
+            return []
+        with self._lock:
+            candidates = None
+            for ids in sorted((self._postings.get(g, set()) for g in query_grams(query)), key=len):
+                candidates = set(ids) if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+            # Trigrams are not positional, so drop false candidates cheaply first
+            needle = query if len(query) >= 3 else ' ' + query
+            return [(parcel_id, self._docs[parcel_id][0]) for parcel_id in candidates or ()
+                    if needle in self._docs[parcel_id][1]]
+
+    # (-score, parcel_id) for every matching parcel, best first once sorted
+    def _scored(self, query):
+        scored = []
+        for parcel_id, values in self._verified(query):
+            best = 0
+            for field, value in values.items():
+                kind = _match(query, value)
+                if kind:
+                    best = max(best, MATCH_SCORES[kind] + FIELD_SCORES.get(field, 0))
+            if best:
+                scored.append((-best, parcel_id))
+        return scored
+
+    # Ranked parcel IDs whose fields contain the query, plus the total count
+    def search(self, query, page=1, per_page=20):
+        scored = self._scored(' '.join(query.lower().split()))
+        scored.sort()
+        start = (max(page, 1) - 1) * per_page
+        return [parcel_id for _, parcel_id in scored[start:start + per_page]], len(scored)
+
+    # Unranked set of matching parcel IDs, for use as a filter
+    def matching_ids(self, query):
+        return {parcel_id for parcel_id, _ in self._verified(' '.join(query.lower().split()))}
+
+    # Upper bound on the number of matches: the size of the rarest trigram's postings
+    def estimate(self, query):
+        query = ' '.join(query.lower().split())
+        if not query:
+            return 0
+        with self._lock:
+            return min(len(self._postings.get(g, ())) for g in query_grams(query))
+
+    # Check one parcel without touching the postings, for filtering while scanning
+    def matches(self, parcel_id, query):
+        query = ' '.join(query.lower().split())
+        doc = self._docs.get(parcel_id)
+        if not doc or not query:
+            return False
+        needle = query if len(query) >= 3 else ' ' + query
+        return needle in doc[1] and any(_match(query, v) for v in doc[0].values())
@@ -0,0 +1,408 @@
+# SQLite storage backend, same interface as the JSON stores in parcel_store.py.
+#
+# Parcels, tracking events and change requests live in normalized tables so
+# lookups hit an index and single-parcel updates touch one row in a transaction.
+# Every parcel write also records the parcel ID in parcel_changes, which is how
+# in-memory listeners in this and other processes catch up in sync().
+# SQLite's own locking makes it safe for several worker processes; every
+# write bumps the parcel's `version` like the JSON store does.
+import json, os, sqlite3, threading
+from contextlib import contextmanager
+from parcel_store import normalize_parcel, stamp_change_request, modify_parcel, utc_now, VersionConflict, SCHEMA_VERSION
+
+PARCEL_COLUMNS = [
+    'name', 'sender_name', 'receiver_name', 'status', 'address', 'start_address',
+    'end_address', 'price', 'phone', 'email', 'payment_type', 'region', 'image',
+    'current_location', 'version', 'updated_at'
+]
+EVENT_COLUMNS = ['status', 'location', 'description', 'subtext', 'timestamp']
+REQUEST_COLUMNS = ['request_id', 'created_at', 'new_address', 'new_phone', 'new_region']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS parcels (
+    id TEXT PRIMARY KEY,
+    id_lower TEXT NOT NULL UNIQUE,
+    name TEXT, sender_name TEXT, receiver_name TEXT, status TEXT, address TEXT,
+    start_address TEXT, end_address TEXT, price TEXT, phone TEXT, email TEXT,
+    payment_type TEXT, region TEXT, image TEXT, current_location TEXT,
+    version INTEGER, updated_at TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_parcels_status ON parcels(status);
+CREATE INDEX IF NOT EXISTS idx_parcels_region ON parcels(region);
+CREATE INDEX IF NOT EXISTS idx_parcels_sender_name ON parcels(sender_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_parcels_receiver_name ON parcels(receiver_name COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS tracking_events (
+    parcel_id TEXT NOT NULL REFERENCES parcels(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    status TEXT, location TEXT, description TEXT, subtext TEXT, timestamp TEXT,
+    extra TEXT,
+    PRIMARY KEY (parcel_id, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_tracking_events_timestamp ON tracking_events(timestamp);
+
+CREATE TABLE IF NOT EXISTS change_requests (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    parcel_id TEXT NOT NULL,
+    request_id TEXT, created_at TEXT,
+    new_address TEXT, new_phone TEXT, new_region TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_change_requests_parcel ON change_requests(parcel_id);
+
+CREATE TABLE IF NOT EXISTS parcel_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    parcel_id TEXT NOT NULL
+);
+'''
+
+
+# Split a dict into known column values and a JSON blob for everything else
+def _split(record, columns, skip=()):
+    values = [record.get(c) for c in columns]
+    extra = {k: v for k, v in record.items() if k not in columns and k not in skip}
+    return values, (json.dumps(extra) if extra else None)
+
+
+def _merge(row, columns, skip=0):
+    record = {c: row[skip + i] for i, c in enumerate(columns) if row[skip + i] is not None}
+    extra = row[skip + len(columns)]
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+# One connection per thread, shared by the parcel and change request stores
+class SqliteDatabase:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        fresh = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'parcels'").fetchone() is None
+        self.conn.executescript(SCHEMA)
+        if fresh:
+            self.set_schema_version(SCHEMA_VERSION)
+        # Databases created before parcels had versions
+        columns = {r[1] for r in self.conn.execute('PRAGMA table_info(parcels)')}
+        for column, kind in (('version', 'INTEGER'), ('updated_at', 'TEXT')):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE parcels ADD COLUMN {column} {kind}')
+        # Databases created before change requests had keys
+        columns = {r[1] for r in self.conn.execute('PRAGMA table_info(change_requests)')}
+        for column in ('request_id', 'created_at'):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE change_requests ADD COLUMN {column} TEXT')
+        self.conn.execute("UPDATE change_requests SET request_id = lower(hex(randomblob(6))) WHERE request_id IS NULL")
+        self.conn.execute("UPDATE change_requests SET created_at = datetime('now', 'localtime') WHERE created_at IS NULL")
+        self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_change_requests_request_id ON change_requests(request_id)')
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    # Schema version of the stored records, kept in the database header.
+    # Databases from before it was set report 1.
+    def schema_version(self):
+        return self.conn.execute('PRAGMA user_version').fetchone()[0] or 1
+
+    def set_schema_version(self, version):
+        self.conn.execute(f'PRAGMA user_version = {int(version)}')
+
+    # Nested calls join the outermost transaction
+    @contextmanager
+    def transaction(self):
+        conn = self.conn
+        if self._local.depth == 0:
+            conn.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                conn.execute('ROLLBACK')
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            conn.execute('COMMIT')
+
+
+class SqliteParcelStore:
+    # The change log is trimmed by sync() every `compact_every` changes, so
+    # it stays bounded without the archive CLI
+    def __init__(self, db, compact_every=10000):
+        self.db = db
+        self.compact_every = compact_every
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._change_seq = 0
+        self._compacted_seq = 0
+
+    def _changed(self, conn, parcel_id):
+        conn.execute('INSERT INTO parcel_changes (parcel_id) VALUES (?)', (parcel_id,))
+
+    # Register an index that follows every change to the parcels
+    def add_listener(self, listener):
+        self.add_listeners(listener)
+
+    # Register several indexes, all reset from one load of the tables
+    def add_listeners(self, *listeners):
+        with self._lock:
+            if not self._listeners:
+                self._change_seq = self.db.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM parcel_changes').fetchone()[0]
+            self._listeners.extend(listeners)
+            parcels = self.all()
+            for listener in listeners:
+                listener.reset(parcels)
+
+    # Feed parcels changed since the last call (by any process) to the listeners
+    def sync(self):
+        if not self._listeners:
+            return
+        with self._lock:
+            rows = self.db.conn.execute(
+                'SELECT seq, parcel_id FROM parcel_changes WHERE seq > ? ORDER BY seq', (self._change_seq,)
+            ).fetchall()
+            if not rows:
+                return
+            for parcel_id in dict.fromkeys(r[1] for r in rows):
+                parcel = self.get(parcel_id)
+                for listener in self._listeners:
+                    listener.apply(parcel_id, parcel)
+            self._change_seq = rows[-1][0]
+            if self._change_seq - self._compacted_seq >= self.compact_every:
+                self.compact()
+                self._compacted_seq = self._change_seq
+
+    def _select_sql(self, where=''):
+        return f"SELECT id, {', '.join(PARCEL_COLUMNS)}, extra FROM parcels {where}"
+
+    def _row_to_parcel(self, row, events):
+        parcel = {'id': row[0]}
+        parcel.update(_merge(row, PARCEL_COLUMNS, skip=1))
+        parcel['tracking_history'] = events
+        return parcel
+
+    def _events(self, parcel_id):
+        rows = self.db.conn.execute(
+            f"SELECT {', '.join(EVENT_COLUMNS)}, extra FROM tracking_events WHERE parcel_id = ? ORDER BY seq",
+            (parcel_id,)
+        )
+        return [_merge(r, EVENT_COLUMNS) for r in rows]
+
+    def _next_version(self, conn, parcel_id):
+        row = conn.execute('SELECT version FROM parcels WHERE id = ?', (parcel_id,)).fetchone()
+        return ((row[0] or 0) if row else 0) + 1
+
+    def _bump(self, conn, parcel_id):
+        conn.execute('UPDATE parcels SET version = COALESCE(version, 0) + 1, updated_at = ? WHERE id = ?',
+                     (utc_now(), parcel_id))
+
+    def _insert(self, conn, parcel):
+        values, extra = _split(parcel, PARCEL_COLUMNS, skip=('id', 'tracking_history'))
+        conn.execute(
+            f"INSERT OR REPLACE INTO parcels (id, id_lower, {', '.join(PARCEL_COLUMNS)}, extra) "
+            f"VALUES ({', '.join('?' * (len(PARCEL_COLUMNS) + 3))})",
+            [parcel['id'], parcel['id'].lower()] + values + [extra]
+        )
+        conn.execute('DELETE FROM tracking_events WHERE parcel_id = ?', (parcel['id'],))
+        for seq, event in enumerate(parcel.get('tracking_history', [])):
+            self._insert_event(conn, parcel['id'], seq, event)
+        self._changed(conn, parcel['id'])
+
+    def _insert_event(self, conn, parcel_id, seq, event):
+        values, extra = _split(event, EVENT_COLUMNS)
+        conn.execute(
+            f"INSERT INTO tracking_events (parcel_id, seq, {', '.join(EVENT_COLUMNS)}, extra) "
+            f"VALUES ({', '.join('?' * (len(EVENT_COLUMNS) + 3))})",
+            [parcel_id, seq] + values + [extra]
+        )
+
+    def batch(self):
+        return self.db.transaction()
+
+    # Trim the change log, keeping enough for listeners that are a bit behind
+    def compact(self, keep=100000):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM parcel_changes WHERE seq <= (SELECT MAX(seq) FROM parcel_changes) - ?', (keep,))
+
+    def all(self):
+        conn = self.db.conn
+        events = {}
+        rows = conn.execute(
+            f"SELECT parcel_id, {', '.join(EVENT_COLUMNS)}, extra FROM tracking_events ORDER BY parcel_id, seq"
+        )
+        for r in rows:
+            events.setdefault(r[0], []).append(_merge(r, EVENT_COLUMNS, skip=1))
+        return [self._row_to_parcel(r, events.get(r[0], []))
+                for r in conn.execute(self._select_sql('ORDER BY rowid'))]
+
+    # Iterate over parcels a chunk at a time so exports keep memory flat
+    def iter_all(self, chunk_size=500):
+        last_rowid = 0
+        while True:
+            rows = self.db.conn.execute(
+                f"SELECT rowid, id, {', '.join(PARCEL_COLUMNS)}, extra FROM parcels WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            events = self._events_for([r[1] for r in rows])
+            for r in rows:
+                yield self._row_to_parcel(r[1:], events.get(r[1], []))
+            last_rowid = rows[-1][0]
+
+    # Tracking events of several parcels in one query, by parcel ID
+    def _events_for(self, parcel_ids):
+        events = {}
+        placeholders = ', '.join('?' * len(parcel_ids))
+        for r in self.db.conn.execute(
+            f"SELECT parcel_id, {', '.join(EVENT_COLUMNS)}, extra FROM tracking_events "
+            f"WHERE parcel_id IN ({placeholders}) ORDER BY parcel_id, seq",
+            parcel_ids
+        ):
+            events.setdefault(r[0], []).append(_merge(r, EVENT_COLUMNS, skip=1))
+        return events
+
+    # Parcels for a list of IDs in that order, skipping unknown ones. Two
+    # queries per chunk, read lazily so large lists keep memory flat.
+    def get_many(self, parcel_ids, chunk_size=500):
+        parcel_ids = list(parcel_ids)
+        for start in range(0, len(parcel_ids), chunk_size):
+            chunk = parcel_ids[start:start + chunk_size]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = {r[0]: r for r in self.db.conn.execute(self._select_sql(f'WHERE id IN ({placeholders})'), chunk)}
+            events = self._events_for(list(rows))
+            for parcel_id in chunk:
+                if parcel_id in rows:
+                    yield self._row_to_parcel(rows[parcel_id], events.get(parcel_id, []))
+
+    def get(self, parcel_id):
+        row = self.db.conn.execute(self._select_sql('WHERE id = ?'), (parcel_id,)).fetchone()
+        return self._row_to_parcel(row, self._events(row[0])) if row else None
+
+    def find(self, query):
+        row = self.db.conn.execute(self._select_sql('WHERE id_lower = ?'), (query.strip().lower(),)).fetchone()
+        return self._row_to_parcel(row, self._events(row[0])) if row else None
+
+    def add(self, parcel):
+        with self.db.transaction() as conn:
+            stamp = {'version': self._next_version(conn, parcel['id']), 'updated_at': utc_now()}
+            self._insert(conn, normalize_parcel(dict(parcel, **stamp)))
+
+    def update(self, parcel_id, fields, expected_version=None):
+        with self.db.transaction() as conn:
+            row = conn.execute('SELECT extra, version FROM parcels WHERE id = ?', (parcel_id,)).fetchone()
+            if row is None:
+                raise KeyError(parcel_id)
+            if expected_version is not None and (row[1] or 0) != expected_version:
+                raise VersionConflict(parcel_id, expected_version, row[1] or 0)
+            fields = dict(fields, version=(row[1] or 0) + 1, updated_at=utc_now())
+            if 'receiver_name' in fields:
+                fields['name'] = fields['receiver_name']
+            columns = [c for c in fields if c in PARCEL_COLUMNS]
+            extra = json.loads(row[0]) if row[0] else {}
+            extra.update({k: v for k, v in fields.items() if k not in PARCEL_COLUMNS and k not in ('id', 'tracking_history')})
+            assignments = ''.join(f'{c} = ?, ' for c in columns)
+            conn.execute(
+                f'UPDATE parcels SET {assignments}extra = ? WHERE id = ?',
+                [fields[c] for c in columns] + [json.dumps(extra) if extra else None, parcel_id]
+            )
+            self._changed(conn, parcel_id)
+
+    def append_event(self, parcel_id, event):
+        with self.db.transaction() as conn:
+            if conn.execute('SELECT 1 FROM parcels WHERE id = ?', (parcel_id,)).fetchone() is None:
+                raise KeyError(parcel_id)
+            seq = conn.execute(
+                'SELECT COALESCE(MAX(seq) + 1, 0) FROM tracking_events WHERE parcel_id = ?', (parcel_id,)
+            ).fetchone()[0]
+            self._insert_event(conn, parcel_id, seq, event)
+            self._bump(conn, parcel_id)
+            self._changed(conn, parcel_id)
+
+    # Read-compute-write with optimistic retries, see ParcelStore.modify
+    def modify(self, parcel_id, change, retries=5):
+        return modify_parcel(self, parcel_id, change, retries)
+
+    def delete(self, parcel_id):
+        with self.db.transaction() as conn:
+            deleted = conn.execute('DELETE FROM parcels WHERE id = ?', (parcel_id,)).rowcount > 0
+            if deleted:
+                self._changed(conn, parcel_id)
+            return deleted
+
+    def save(self, parcels):
+        with self.db.transaction() as conn:
+            for (parcel_id,) in conn.execute('SELECT id FROM parcels').fetchall():
+                self._changed(conn, parcel_id)
+            conn.execute('DELETE FROM parcels')
+            for p in parcels:
+                self._insert(conn, normalize_parcel(p))
+
+
+class SqliteChangeRequestStore:
+    def __init__(self, db):
+        self.db = db
+
+    def _select(self, where='', params=()):
+        rows = self.db.conn.execute(
+            f"SELECT parcel_id, {', '.join(REQUEST_COLUMNS)}, extra FROM change_requests {where}", params
+        )
+        return [dict(id=r[0], **_merge(r, REQUEST_COLUMNS, skip=1)) for r in rows]
+
+    def all(self):
+        return self._select('ORDER BY seq')
+
+    def count(self):
+        return self.db.conn.execute('SELECT COUNT(*) FROM change_requests').fetchone()[0]
+
+    # Oldest first
+    def page(self, offset=0, limit=50):
+        return self._select('ORDER BY seq LIMIT ? OFFSET ?', (limit, offset))
+
+    def get(self, request_id):
+        rows = self._select('WHERE request_id = ?', (request_id,))
+        return rows[0] if rows else None
+
+    def for_parcel(self, parcel_id):
+        return self._select('WHERE parcel_id = ? ORDER BY seq', (parcel_id,))
+
+    def add(self, request_data):
+        with self.db.transaction() as conn:
+            self._insert(conn, stamp_change_request(request_data))
+        return request_data
+
+    def _insert(self, conn, request_data):
+        values, extra = _split(request_data, REQUEST_COLUMNS, skip=('id',))
+        conn.execute(
+            f"INSERT INTO change_requests (parcel_id, {', '.join(REQUEST_COLUMNS)}, extra) "
+            f"VALUES ({', '.join('?' * (len(REQUEST_COLUMNS) + 2))})",
+            [request_data['id']] + values + [extra]
+        )
+
+    # Drop many requests in one transaction, returns the IDs that existed
+    def remove(self, request_ids):
+        removed = set()
+        with self.db.transaction() as conn:
+            for request_id in set(request_ids):
+                if conn.execute('DELETE FROM change_requests WHERE request_id = ?', (request_id,)).rowcount:
+                    removed.add(request_id)
+        return removed
+
+    def save(self, requests):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM change_requests')
+            for r in requests:
+                self._insert(conn, stamp_change_request(r))
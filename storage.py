@@ -0,0 +1,36 @@
+# Pick the storage backend from the app config.
+#
+# STORAGE_BACKEND = 'json'   -> data/parcels.json (+ journal) and data/change_requests.json
+# STORAGE_BACKEND = 'sqlite' -> one SQLite database at SQLITE_PATH
+import os
+from parcel_store import ParcelStore, ChangeRequestStore
+
+BACKENDS = ('json', 'sqlite')
+
+
+# Storage settings from the environment, shared by the app and the CLI scripts.
+# The JSON backend caches parsed parcels per process and re-reads them only when
+# the file changes, and appends mutations to a journal unless TRACKSWIFT_JOURNAL=0.
+def config_from_env(data_dir):
+    return {
+        'STORAGE_BACKEND': os.environ.get('TRACKSWIFT_STORAGE', 'json'),
+        'PARCEL_FILE': os.path.join(data_dir, 'parcels.json'),
+        'CHANGE_REQUESTS_FILE': os.path.join(data_dir, 'change_requests.json'),
+        'SQLITE_PATH': os.environ.get('TRACKSWIFT_SQLITE_PATH', os.path.join(data_dir, 'trackswift.db')),
+        'PARCEL_JOURNAL': os.environ.get('TRACKSWIFT_JOURNAL', '1') != '0',
+        'JOURNAL_COMPACT_BYTES': int(os.environ.get('TRACKSWIFT_JOURNAL_COMPACT_BYTES', 4 * 1024 * 1024))
+    }
+
+
+# Returns (parcel_store, change_request_store) for the configured backend
+def open_stores(config):
+    backend = config.get('STORAGE_BACKEND', 'json')
+    if backend == 'json':
+        parcels = ParcelStore(config['PARCEL_FILE'], journal=config.get('PARCEL_JOURNAL', True),
+                              compact_bytes=config.get('JOURNAL_COMPACT_BYTES', 4 * 1024 * 1024))
+        return parcels, ChangeRequestStore(config['CHANGE_REQUESTS_FILE'])
+    if backend == 'sqlite':
+        from sqlite_store import SqliteDatabase, SqliteParcelStore, SqliteChangeRequestStore
+        db = SqliteDatabase(config['SQLITE_PATH'])
+        return SqliteParcelStore(db), SqliteChangeRequestStore(db)
+    raise ValueError(f"Unknown storage backend {backend!r}, expected one of {BACKENDS}")
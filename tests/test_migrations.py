@@ -0,0 +1,159 @@
+# Schema migration steps and the JSON/SQLite migrate paths, run on the
+# version 1 layout: bare JSON arrays, parcels without the later fields,
+# change requests without keys and display-form event times.
+import copy, json, os
+from migrations import PARCEL_STEPS, REQUEST_STEPS, upgrade_parcel, upgrade_request, data_versions, migrate_data
+from parcel_store import SCHEMA_VERSION, normalize_parcel, stamp_change_request
+from storage import config_from_env
+from timestamps import canonicalize_event_times
+
+V1_PARCEL = {
+    'id': 'TRK202635488',
+    'name': 'Rahul Khanna',
+    'status': 'In Transit',
+    'address': 'Flat 715, Palm Grove, Bangalore, Karnataka',
+    'price': '₹ 499',
+    'tracking_history': [
+        {'status': 'Order Confirmed', 'timestamp': "Mon, 26th Jan '26 - 09:30am", 'location': 'Online'},
+        {'status': 'Picked Up', 'timestamp': '2026-01-27 14:15', 'location': 'Main Warehouse, Hyderabad'},
+        {'status': 'In Transit', 'timestamp': "wed, 28th jan '26 - 11:00am", 'location': 'Secunderabad, Hyderabad'},
+        {'status': 'On Hold', 'timestamp': 'sometime next week', 'location': 'Secunderabad, Hyderabad'},
+        {'status': 'Note', 'timestamp': '', 'location': ''},
+    ]
+}
+V1_REQUEST = {'id': 'TRK202635488', 'new_phone': '+91 9000000000'}
+
+CANONICAL_TIMES = ['2026-01-26T09:30:00', '2026-01-27T14:15:00', '2026-01-28T11:00:00']
+
+
+def v1_parcel():
+    return copy.deepcopy(V1_PARCEL)
+
+
+def write_v1_json(data_dir):
+    os.makedirs(data_dir, exist_ok=True)
+    with open(os.path.join(data_dir, 'parcels.json'), 'w', encoding='utf-8') as f:
+        json.dump([v1_parcel()], f)
+    with open(os.path.join(data_dir, 'change_requests.json'), 'w', encoding='utf-8') as f:
+        json.dump([dict(V1_REQUEST)], f)
+
+
+def read_json(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def check_migrated_parcel(parcel):
+    assert parcel['receiver_name'] == 'Rahul Khanna' and parcel['name'] == 'Rahul Khanna'
+    assert parcel['sender_name'] == 'Unknown Sender'
+    assert parcel['end_address'] == parcel['current_location'] == V1_PARCEL['address']
+    assert parcel['start_address'] == '' and parcel['image'] == ''
+    history = parcel['tracking_history']
+    assert [e.get('timestamp') for e in history[:3]] == CANONICAL_TIMES
+    assert 'timestamp' not in history[3] and history[3]['timestamp_text'] == 'sometime next week'
+    assert 'timestamp' not in history[4] and 'timestamp_text' not in history[4]
+
+
+def check_migrated_request(request_data):
+    assert request_data['new_phone'] == V1_REQUEST['new_phone']
+    assert request_data['request_id'] and request_data['created_at']
+
+
+def test_steps_are_ordered_and_end_at_current_version():
+    for steps in (PARCEL_STEPS, REQUEST_STEPS):
+        versions = [version for version, _, _ in steps]
+        assert versions == sorted(versions) and len(set(versions)) == len(versions)
+    assert PARCEL_STEPS[-1][0] == SCHEMA_VERSION
+
+
+def test_step_2_fills_parcel_fields():
+    parcel = normalize_parcel(v1_parcel())
+    assert parcel['receiver_name'] == parcel['name'] == 'Rahul Khanna'
+    assert parcel['sender_name'] == 'Unknown Sender'
+    assert parcel['end_address'] == parcel['current_location'] == V1_PARCEL['address']
+    # Times are left for step 3
+    assert parcel['tracking_history'] == V1_PARCEL['tracking_history']
+
+
+def test_step_2_keys_change_requests():
+    request_data = stamp_change_request(dict(V1_REQUEST))
+    check_migrated_request(request_data)
+    again = stamp_change_request(dict(request_data))
+    assert again == request_data
+
+
+def test_step_3_canonical_event_times():
+    parcel = canonicalize_event_times(v1_parcel())
+    history = parcel['tracking_history']
+    assert [e['timestamp'] for e in history[:3]] == CANONICAL_TIMES
+    assert history[3] == {'status': 'On Hold', 'timestamp_text': 'sometime next week', 'location': 'Secunderabad, Hyderabad'}
+    assert history[4] == {'status': 'Note', 'location': ''}
+
+
+def test_upgrade_from_v1_and_again():
+    parcel = upgrade_parcel(v1_parcel(), 1)
+    check_migrated_parcel(parcel)
+    assert upgrade_parcel(copy.deepcopy(parcel), 1) == parcel
+    assert upgrade_parcel(copy.deepcopy(parcel), SCHEMA_VERSION) == parcel
+    check_migrated_request(upgrade_request(dict(V1_REQUEST), 1))
+
+
+def test_upgrade_skips_steps_at_or_below_from_version():
+    parcel = upgrade_parcel(v1_parcel(), 2)
+    # Step 2 did not run, step 3 did
+    assert 'sender_name' not in parcel
+    assert [e.get('timestamp') for e in parcel['tracking_history'][:3]] == CANONICAL_TIMES
+
+
+def test_migrate_json(tmp_path):
+    data_dir = str(tmp_path)
+    write_v1_json(data_dir)
+    config = config_from_env(data_dir)
+    config['STORAGE_BACKEND'] = 'json'
+    assert data_versions(config) == {'parcels': 1, 'change_requests': 1}
+
+    migrate_data(config)
+    assert data_versions(config) == {'parcels': SCHEMA_VERSION, 'change_requests': SCHEMA_VERSION}
+    parcels = json.loads(read_json(config['PARCEL_FILE']))
+    requests = json.loads(read_json(config['CHANGE_REQUESTS_FILE']))
+    assert parcels['schema_version'] == requests['schema_version'] == SCHEMA_VERSION
+    [parcel] = parcels['parcels']
+    check_migrated_parcel(parcel)
+    [request_data] = requests['change_requests']
+    check_migrated_request(request_data)
+
+    # A second run leaves both files as they are
+    before = read_json(config['PARCEL_FILE']), read_json(config['CHANGE_REQUESTS_FILE'])
+    migrate_data(config)
+    assert (read_json(config['PARCEL_FILE']), read_json(config['CHANGE_REQUESTS_FILE'])) == before
+
+
+def test_migrate_sqlite(tmp_path):
+    from sqlite_store import SqliteDatabase, SqliteParcelStore, SqliteChangeRequestStore
+    config = config_from_env(str(tmp_path))
+    config['STORAGE_BACKEND'] = 'sqlite'
+    config['SQLITE_PATH'] = str(tmp_path / 'trackswift.db')
+
+    # Rows as a version 1 database held them: not normalized, no request keys
+    db = SqliteDatabase(config['SQLITE_PATH'])
+    with db.transaction() as conn:
+        SqliteParcelStore(db)._insert(conn, v1_parcel())
+        conn.execute('INSERT INTO change_requests (parcel_id, new_phone) VALUES (?, ?)',
+                     (V1_REQUEST['id'], V1_REQUEST['new_phone']))
+        db.set_schema_version(0)
+    assert data_versions(config) == {'sqlite': 1}
+
+    migrate_data(config)
+    assert data_versions(config) == {'sqlite': SCHEMA_VERSION}
+    db = SqliteDatabase(config['SQLITE_PATH'])
+    [parcel] = SqliteParcelStore(db).all()
+    check_migrated_parcel(parcel)
+    [request_data] = SqliteChangeRequestStore(db).all()
+    check_migrated_request(request_data)
+
+    # A second run does not rewrite anything
+    changes = db.conn.execute('SELECT COUNT(*) FROM parcel_changes').fetchone()[0]
+    migrate_data(config)
+    assert db.conn.execute('SELECT COUNT(*) FROM parcel_changes').fetchone()[0] == changes
+    assert SqliteParcelStore(db).all() == [parcel]
+    assert SqliteChangeRequestStore(db).all() == [request_data]
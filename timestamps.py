@@ -0,0 +1,105 @@
+# Timestamps on tracking events.
+#
+# Events store one canonical form, ISO 8601 to the second in the ops team's
+# local time, e.g. "2026-01-30T18:20:00", so they sort and compare as
+# strings. Templates format them for display with format_event_timestamp.
+#
+# Before schema version 3 events carried "2026-01-30 18:20" (create/approve)
+# or the display form "Fri, 30th Jan '26 - 06:20pm" (edit_parcel and
+# reset_data.py), sometimes lowercased; canonicalize_event_times() converts
+# them. Scanners and imports may still send any of the formats below.
+import datetime, functools, re
+
+EVENT_TIME_FORMATS = (
+    "%Y-%m-%d %H:%M", "%a, %d %b '%y - %I:%M%p",
+    # Accepted from scanners and imports
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"
+)
+DAY_SUFFIX = re.compile(r'(\d+)(st|nd|rd|th)\b', re.IGNORECASE)
+
+
+# Returns a naive datetime, or None when the string is in no known format.
+# ISO 8601 with an offset is converted to local time first.
+# Cached because the same minute-resolution strings repeat across parcels.
+@functools.lru_cache(maxsize=65536)
+def parse_event_timestamp(text):
+    if not text:
+        return None
+    try:
+        return to_local(datetime.datetime.fromisoformat(text))
+    except ValueError:
+        pass
+    text = DAY_SUFFIX.sub(r'\1', text.strip())
+    for fmt in EVENT_TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+# Naive local time of a datetime; aware ones are converted, not just stripped
+def to_local(dt):
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+# Stored form of an event time, e.g. "2026-01-30T18:20:00"
+def canonical_event_timestamp(dt):
+    return to_local(dt).replace(microsecond=0).isoformat()
+
+
+def now_event_timestamp():
+    return canonical_event_timestamp(datetime.datetime.now())
+
+
+# Display form used on tracking pages, e.g. "Fri, 30th Jan '26 - 06:20pm".
+# Takes a datetime or a stored timestamp; text that is neither is returned as is.
+def format_event_timestamp(dt):
+    if not isinstance(dt, datetime.datetime):
+        parsed = parse_event_timestamp(dt) if isinstance(dt, str) else None
+        if parsed is None:
+            return dt or ''
+        dt = parsed
+    day = dt.day
+    suffix = "th" if 11 <= day <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(day % 10, "th")
+    return dt.strftime(f"%a, {day}{suffix} %b '%y - %I:%M") + dt.strftime('%p').lower()
+
+
+# Times are local and naive; they are read as UTC so epochs compare with
+# each other, never with real UTC clocks
+def to_epoch(dt):
+    return dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+# Seconds since the epoch of one event, None when it has no usable time
+def event_time(event):
+    dt = parse_event_timestamp(event.get('timestamp'))
+    return to_epoch(dt) if dt else None
+
+
+# Seconds since the epoch of a parcel's latest tracking event, 0 when unknown
+def last_event_time(parcel):
+    history = parcel.get('tracking_history') or []
+    if not history:
+        return 0
+    return event_time(history[-1]) or 0
+
+
+# Schema step 3: rewrite every event time in the canonical form. Text that
+# does not parse (free-form input kept by older versions of the edit form)
+# moves to timestamp_text so `timestamp` only ever holds a real time.
+def canonicalize_event_times(parcel):
+    for event in parcel.get('tracking_history') or []:
+        text = event.get('timestamp')
+        if text is None:
+            continue
+        dt = parse_event_timestamp(str(text))
+        if dt is not None:
+            event['timestamp'] = canonical_event_timestamp(dt)
+        else:
+            del event['timestamp']
+            if str(text).strip():
+                event['timestamp_text'] = str(text)
+    return parcel